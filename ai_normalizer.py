@@ -10,28 +10,124 @@ Los leads procesados por IA quedan marcados con 🤖 al inicio de 'observacion'.
 Uso:
     python ai_normalizer.py prueba1.csv
     python ai_normalizer.py prueba1.csv --output mi_salida.csv
+    python ai_normalizer.py prueba1.csv --workers 4
+    python ai_normalizer.py prueba1.csv --refresh-cache
+    python ai_normalizer.py prueba1.csv --resume      # retoma una corrida interrumpida
+    python ai_normalizer.py prueba1.csv --deadline 30m  # calientes primero; lo que no alcance, heurística
+    python ai_normalizer.py prueba1.csv --backfill    # resume con IA solo los leads que quedaron pendientes
+    python ai_normalizer.py prueba1.csv --prom-textfile /var/lib/node_exporter/leads.prom
+    python ai_normalizer.py prueba1.csv --pg-dsn postgresql://usuario@127.0.0.1/antigravity_db
 """
 
-import os, sys, re, json, ast, subprocess, time, argparse
-from typing import Tuple
+import os, sys, re, csv, json, subprocess, time, argparse, hashlib, sqlite3, threading
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional, Tuple
 
-import pandas as pd
 import requests
 
+from lead_index import INDEX_PATH, LeadIndex, identity_keys
+from llm_guard import LLMGuard, retry_delay
+from memo import MEMO_MAX_VALUES, ValueMemo, text_memo_size
+from pg_copy import BATCH_ROWS as PG_BATCH_ROWS, export_copy, iter_copy_blocks, update_copy_blocks
+from run_metrics import RunMetrics
+from transcript import decode_transcript, unescape_doubled_quotes
+
 # ─────────────────────────────────────────
 # CONFIGURACIÓN
 # ─────────────────────────────────────────
 OLLAMA_URL   = "http://127.0.0.1:11434/api/generate"
 OLLAMA_MODEL = "llama3.2:latest"
-MAX_CONV_CHARS = 4500
+MAX_CONV_CHARS = 4500   # corte de la conversación para extraer campos (el prompt usa un presupuesto)
 TEMPERATURE    = 0.2
 NUM_PREDICT    = 280
-TIMEOUT        = (10, 300)
+TIMEOUT        = (10, 300)   # (conexión, lectura máxima); la lectura se adapta a la latencia
 KEEP_ALIVE     = "20m"
 
+# Timeouts adaptativos, reintentos y circuit breaker (ver llm_guard.py)
+MIN_READ_TIMEOUT      = 20
+LLM_RETRIES           = 2
+BREAKER_FAILURES      = 5
+BREAKER_PROBE_SECONDS = 30
+
+# Columnas del CSV de salida, en el orden de las claves de process_lead
+OUTPUT_COLUMNS = ["nombre", "email", "telefono", "rut", "renta", "proyecto",
+                  "observacion", "es_ia", "es_caliente"]
+
+CACHE_PATH         = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ai_cache.sqlite3")
+CACHE_MAX_ENTRIES  = 50_000
+CACHE_MAX_AGE_DAYS = 30
+
+# Grupos de conversaciones repetidas que se recuerdan durante una corrida
+COALESCE_MAX_GROUPS = 10_000
+
+# Prompt (ver PromptBuilder): conversación en tokens estimados, líneas BOT que
+# no son plantilla acortadas, y plantillas del bot detectadas en los primeros
+# leads de la corrida
+CONV_TOKEN_BUDGET     = 1000
+BOT_LINE_TOKENS       = 40
+TEMPLATE_SAMPLE_LEADS = 2000
+TEMPLATE_MIN_LEADS    = 3
+TEMPLATE_WORDS        = 6
+
+# Las instrucciones fijas van primero y los datos del lead al final: el
+# prefijo común (instrucciones y, muchas veces, el saludo del bot) Ollama lo
+# reutiliza de la llamada anterior en vez de evaluarlo de nuevo.
+PROMPT_TEMPLATE = """Eres un asistente de ventas inmobiliarias. Redacta un resumen BREVE y DIRECTO para un ejecutivo humano.
+
+INSTRUCCIONES:
+- Analiza solo lo que dice CLIENTE:, el BOT: es contexto.
+- "…" y "[…]" marcan texto abreviado u omitido.
+- Sin JSON, sin tablas, sin adornos. Solo texto plano útil.
+- 3 secciones cortas: Resumen, Datos Clave, Siguiente Paso.
+
+CONVERSACIÓN:
+\"\"\"{conv}\"\"\"
+
+LEAD:
+- Nombre: {nombre}
+- Teléfono: {telefono}
+- Estado: {estado}
+
+FIN
+"""
+
+# --pack: conversaciones cortas (hasta PACK_MAX_CLIENT_LINES mensajes del
+# cliente y PACK_MAX_TOKENS tokens) se resumen de a varias por llamada. El
+# primer lead de un lote espera hasta PACK_WAIT_SECONDS a que se llene.
+PACK_MAX_CLIENT_LINES = 3
+PACK_MAX_TOKENS       = 300
+PACK_WAIT_SECONDS     = 2.0
+# Respuestas empaquetadas seguidas sin ninguna sección reconocible tras las
+# que se deja de empaquetar (el modelo no sigue el formato)
+PACK_MAX_UNPARSED     = 3
+
+PACK_TEMPLATE = """Eres un asistente de ventas inmobiliarias. Redacta un resumen BREVE y DIRECTO para un ejecutivo humano por cada lead.
+
+INSTRUCCIONES:
+- Analiza solo lo que dice CLIENTE:, el BOT: es contexto.
+- "…" y "[…]" marcan texto abreviado u omitido.
+- Sin JSON, sin tablas, sin adornos. Solo texto plano útil.
+- 3 secciones cortas por lead: Resumen, Datos Clave, Siguiente Paso.
+- Hay {n} leads. Responde cada uno por separado y en orden, empezando con su línea "### LEAD <número>".
+
+{leads}
+FIN
+"""
+
+PACK_LEAD_TEMPLATE = """### LEAD {id}
+CONVERSACIÓN:
+\"\"\"{conv}\"\"\"
+- Nombre: {nombre}
+- Teléfono: {telefono}
+- Estado: {estado}
+"""
+
 EMAIL_RE = re.compile(r"[a-z0-9][\w.\-]*@[\w.\-]+\.\w+", re.IGNORECASE)
-RUT_RE   = re.compile(r"\b(\d{1,2}\.?\d{3}\.?\d{3}|\d{7,8})-?([\dkK])\b")
-PHONE_RE = re.compile(r"\b(56\d{9}|\d{8,9})\b")
+# (?=\d) no cambia qué calza, pero deja al motor saltar rápido las posiciones sin dígito
+RUT_RE   = re.compile(r"(?=\d)\b(\d{1,2}\.?\d{3}\.?\d{3}|\d{7,8})-?([\dkK])\b")
+PHONE_RE = re.compile(r"(?=\d)\b(56\d{9}|\d{8,9})\b")
+NON_DIGIT_RE = re.compile(r"\D")
 
 MONEY_MIL_RE  = re.compile(r"\b(\d{2,4})\s*(mil)\b", re.IGNORECASE)
 MONEY_MILL_RE = re.compile(r"\b(\d+(?:[.,]\d+)?)\s*(millones?|millón)\b", re.IGNORECASE)
@@ -63,6 +159,13 @@ def ensure_ollama(session: requests.Session):
             print("❌ 'ollama' no encontrado. Instálalo en https://ollama.com")
             sys.exit(1)
 
+def ollama_session(pool_size: int = 1) -> requests.Session:
+    """Sesión HTTP con un solo pool de hasta pool_size conexiones, compartido por todos los hilos."""
+    session = requests.Session()
+    if pool_size > 1:
+        session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+    return session
+
 def warmup(session: requests.Session):
     payload = {"model": OLLAMA_MODEL, "prompt": "OK\nFIN",
                 "stream": False, "keep_alive": KEEP_ALIVE,
@@ -77,115 +180,120 @@ def warmup(session: requests.Session):
 # ─────────────────────────────────────────
 # LECTURA DEL CSV "ENVUELTO" de prueba1
 # ─────────────────────────────────────────
-def read_csv_envuelto(path: str) -> pd.DataFrame:
+def read_csv_envuelto(path: str) -> "pd.DataFrame":
     """
     prueba1.csv usa un formato donde toda la fila va dentro de comillas dobles
     externas, y las comillas internas del JSON están duplicadas (\"\" -> ").
     Este parser lo maneja correctamente.
-    """
-    with open(path, "r", encoding="utf-8", errors="replace") as f:
-        content = f.read()
-
-    # Elimina BOM si existe
-    content = content.lstrip("\ufeff")
-    lines = content.splitlines()
-    if not lines:
-        return pd.DataFrame()
-
-    header_line = lines[0]
-    # Detectar delimitador: Priorizar ';' según el manual de usuario
-    delim = ";" if ";" in header_line else ","
-
-    rows = []
-    for raw in lines[1:]:
-        if not raw.strip():
-            continue
-
-        # Cada fila viene envuelta en comillas dobles externas, desenvuelve
-        inner = raw
-        if inner.startswith('"') and inner.endswith('"'):
-            inner = inner[1:-1]
 
-        # Restaura comillas internas: "" -> "
-        inner = inner.replace('""', '"')
+    El normalizador no usa pandas (lee con iter_csv_envuelto): solo se importa aquí.
+    """
+    import pandas as pd
+    return pd.DataFrame(list(iter_csv_envuelto(path)))
 
-        # Extrae fecha (primer campo antes del inicio del JSON)
-        # La transcripción es un array JSON que empieza con [{ ...
-        # Estrategia: buscar el delimitador seguido del inicio del array JSON
-        json_pattern = f"{delim}[{{"
-        json_start = inner.find(json_pattern)
+def iter_csv_envuelto(path: str) -> Iterator[dict]:
+    """
+    Versión en streaming de read_csv_envuelto: lee el archivo línea a línea y
+    entrega cada lead apenas se parsea, sin cargar el archivo completo.
+    """
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        delim = None
+        for physical in f:
+            # splitlines() por línea física replica los cortes de content.splitlines()
+            for raw in physical.splitlines():
+                if delim is None:
+                    # Elimina BOM si existe
+                    header_line = raw.lstrip("\ufeff")
+                    # Detectar delimitador: Priorizar ';' según el manual de usuario
+                    delim = ";" if ";" in header_line else ","
+                    continue
+                if not raw.strip():
+                    continue
+                row = parse_linea_envuelta(raw, delim)
+                if row is not None:
+                    yield row
+
+def parse_linea_envuelta(raw: str, delim: str) -> Optional[dict]:
+    """Parsea una fila de datos del CSV envuelto; None si no trae transcripción."""
+    # Cada fila viene envuelta en comillas dobles externas, desenvuelve
+    inner = raw
+    if inner.startswith('"') and inner.endswith('"'):
+        inner = inner[1:-1]
+
+    # Restaura comillas internas: "" -> "
+    inner = inner.replace('""', '"')
+
+    # Extrae fecha (primer campo antes del inicio del JSON)
+    # La transcripción es un array JSON que empieza con [{ ...
+    # Estrategia: buscar el delimitador seguido del inicio del array JSON
+    json_pattern = f"{delim}[{{"
+    json_start = inner.find(json_pattern)
+    if json_start == -1:
+        json_start = inner.find("[{")
         if json_start == -1:
-            json_start = inner.find("[{")
-            if json_start == -1:
-                continue
-
-            prefix = inner[:json_start]
-            rest   = inner[json_start:]
-            prefix_parts = [p.strip() for p in prefix.split(delim)]
-            fecha        = prefix_parts[0] if len(prefix_parts) > 0 else ""
-            nombre       = prefix_parts[1] if len(prefix_parts) > 1 else ""
-            telefono_raw = prefix_parts[2] if len(prefix_parts) > 2 else ""
-        else:
-            prefix       = inner[:json_start]
-            rest         = inner[json_start+1:]   # quita el delimitador
-            prefix_parts = [p.strip() for p in prefix.split(delim)]
-            fecha        = prefix_parts[0] if len(prefix_parts) > 0 else ""
-            nombre       = prefix_parts[1] if len(prefix_parts) > 1 else ""
-            telefono_raw = prefix_parts[2] if len(prefix_parts) > 2 else ""
-
-        # El resto: JSON de transcripción + campos finales
-        # Busca dónde termina el JSON (último "]")
-        last_bracket = rest.rfind("]")
-        if last_bracket == -1:
-            transcripcion_raw = rest
-            suffix_str = ""
-        else:
-            transcripcion_raw = rest[:last_bracket+1]
-            suffix_str = rest[last_bracket+1:].lstrip(",")
-
-        # Campos finales: project_tag, tag_estado, cantidad_mensajes, outcome
-        suffix_parts = [p.strip() for p in suffix_str.split(",")]
-        project_tag      = suffix_parts[0] if len(suffix_parts) > 0 else ""
-        tag_estado       = suffix_parts[1] if len(suffix_parts) > 1 else ""
-        cantidad_mensajes= suffix_parts[2] if len(suffix_parts) > 2 else ""
-        outcome          = suffix_parts[3] if len(suffix_parts) > 3 else ""
-
-        rows.append({
-            "fecha_creacion": fecha.strip('"').strip(),
-            "nombre_usuario": nombre.strip('"').strip(),
-            "telefono_raw":   telefono_raw.strip('"').strip(),
-            "transcripcion":  transcripcion_raw.strip(),
-            "project_tag":    project_tag.strip('"').strip(),
-            "tag_estado":     tag_estado.strip('"').strip(),
-            "cantidad_mensajes": cantidad_mensajes.strip('"').strip(),
-            "outcome":        outcome.strip('"').strip(),
-        })
-
-    return pd.DataFrame(rows)
+            return None
+
+        prefix = inner[:json_start]
+        rest   = inner[json_start:]
+        prefix_parts = [p.strip() for p in prefix.split(delim)]
+        fecha        = prefix_parts[0] if len(prefix_parts) > 0 else ""
+        nombre       = prefix_parts[1] if len(prefix_parts) > 1 else ""
+        telefono_raw = prefix_parts[2] if len(prefix_parts) > 2 else ""
+    else:
+        prefix       = inner[:json_start]
+        rest         = inner[json_start+1:]   # quita el delimitador
+        prefix_parts = [p.strip() for p in prefix.split(delim)]
+        fecha        = prefix_parts[0] if len(prefix_parts) > 0 else ""
+        nombre       = prefix_parts[1] if len(prefix_parts) > 1 else ""
+        telefono_raw = prefix_parts[2] if len(prefix_parts) > 2 else ""
+
+    # El resto: JSON de transcripción + campos finales
+    # Busca dónde termina el JSON (último "]")
+    last_bracket = rest.rfind("]")
+    if last_bracket == -1:
+        transcripcion_raw = rest
+        suffix_str = ""
+    else:
+        transcripcion_raw = rest[:last_bracket+1]
+        suffix_str = rest[last_bracket+1:].lstrip(",")
+
+    # Campos finales: project_tag, tag_estado, cantidad_mensajes, outcome
+    suffix_parts = [p.strip() for p in suffix_str.split(",")]
+    project_tag      = suffix_parts[0] if len(suffix_parts) > 0 else ""
+    tag_estado       = suffix_parts[1] if len(suffix_parts) > 1 else ""
+    cantidad_mensajes= suffix_parts[2] if len(suffix_parts) > 2 else ""
+    outcome          = suffix_parts[3] if len(suffix_parts) > 3 else ""
+
+    return {
+        "fecha_creacion": fecha.strip('"').strip(),
+        "nombre_usuario": nombre.strip('"').strip(),
+        "telefono_raw":   telefono_raw.strip('"').strip(),
+        "transcripcion":  transcripcion_raw.strip(),
+        "project_tag":    project_tag.strip('"').strip(),
+        "tag_estado":     tag_estado.strip('"').strip(),
+        "cantidad_mensajes": cantidad_mensajes.strip('"').strip(),
+        "outcome":        outcome.strip('"').strip(),
+    }
 
 
 # ─────────────────────────────────────────
 # PARSEO DE TRANSCRIPCIÓN JSON
 # ─────────────────────────────────────────
 def unescape_trans(s: str) -> str:
-    if isinstance(s, str) and '""' in s and ('sender' in s or 'message' in s):
-        return s.replace('""', '"')
-    return s
+    return unescape_doubled_quotes(s)
 
 def parse_chat(raw: str) -> str:
     """Convierte la transcripción JSON en texto limpio CLIENTE/BOT."""
     if not raw or not raw.strip():
         return ""
-    raw = unescape_trans(raw.strip())
+    raw = raw.strip()
 
     try:
-        data = json.loads(raw)
-    except Exception:
-        try:
-            data = ast.literal_eval(raw)
-        except Exception:
-            # limpieza básica
-            return re.sub(r'[{}\[\]]', '', raw).strip()
+        # JSON rápido y, si está roto, escáner tolerante de pares sender/message
+        data = decode_transcript(raw)
+    except ValueError:
+        # limpieza básica
+        return re.sub(r'[{}\[\]]', '', unescape_trans(raw)).strip()
 
     if not isinstance(data, list):
         return re.sub(r'[{}\[\]]', '', str(data)).strip()
@@ -204,24 +312,28 @@ def parse_chat(raw: str) -> str:
     text = "\n".join(lines)
     text = re.sub(r"[ \t]+", " ", text)
     text = re.sub(r"\n{3,}", "\n\n", text)
-    return text.strip()[:MAX_CONV_CHARS]
+    return text.strip()
 
 
 # ─────────────────────────────────────────
 # EXTRACCIÓN DE CAMPOS SIN LLM
 # ─────────────────────────────────────────
+def client_lines(conv: str) -> list:
+    return [ln.replace("CLIENTE:", "").strip()
+            for ln in conv.splitlines() if ln.startswith("CLIENTE:")]
+
 def only_client(conv: str) -> str:
-    parts = [ln.replace("CLIENTE:", "").strip()
-             for ln in conv.splitlines() if ln.startswith("CLIENTE:")]
-    return " ".join(parts)
+    return " ".join(client_lines(conv))
 
 def extract_email(conv: str) -> str:
+    if "@" not in conv:
+        return ""
     m = EMAIL_RE.search(conv.lower())
     return m.group(0) if m else ""
 
 def extract_phone(raw_phone: str, conv: str) -> str:
     # normalización chilena
-    digits = re.sub(r'\D', '', raw_phone or "")
+    digits = NON_DIGIT_RE.sub('', raw_phone or "")
     if len(digits) == 11 and digits.startswith("56"):
         return f"+{digits}"
     if len(digits) == 9 and digits.startswith("9"):
@@ -238,7 +350,10 @@ def extract_phone(raw_phone: str, conv: str) -> str:
     return f"+{digits}" if digits else ""
 
 def extract_renta(conv: str) -> str:
-    client = only_client(conv)
+    return renta_from_client(only_client(conv))
+
+def renta_from_client(client: str) -> str:
+    """Renta a partir del texto del CLIENTE ya aislado (ver only_client)."""
     if not INCOME_CTX_RE.search(client):
         return "0"
     m = MONEY_MILL_RE.search(client)
@@ -256,7 +371,7 @@ def extract_renta(conv: str) -> str:
             pass
     m = MONEY_NUM_RE.search(client)
     if m:
-        clean = re.sub(r'[^\d]', '', m.group(1))
+        clean = NON_DIGIT_RE.sub('', m.group(1))
         if clean:
             return clean
     return "0"
@@ -266,6 +381,44 @@ def extract_rut(conv: str) -> str:
     m = RUT_RE.search(conv)
     return m.group(0) if m else ""
 
+def conv_fields(conv: str) -> dict:
+    """
+    Campos que dependen solo de la conversación (email, RUT, renta y líneas
+    del cliente), en una sola pasada: la conversación se divide en líneas una
+    vez y el texto del CLIENTE se arma una vez. Se memoiza por conversación.
+    """
+    lineas = client_lines(conv)
+    if "@" not in conv:
+        email = ""
+    elif conv.isascii():
+        # En ASCII, buscar con IGNORECASE y bajar solo el match equivale a
+        # buscar sobre conv.lower(), sin copiar la conversación entera
+        m = EMAIL_RE.search(conv)
+        email = m.group(0).lower() if m else ""
+    else:
+        email = extract_email(conv)
+    return {
+        "email":    email,
+        "rut":      extract_rut(conv),
+        "renta":    renta_from_client(" ".join(lineas)),
+        "lineas_cliente": lineas,
+    }
+
+def extract_fields(raw_phone: str, conv: str, fields_fn: Callable = conv_fields) -> dict:
+    """
+    Extrae email, teléfono, RUT y renta. Devuelve los mismos valores que las
+    funciones extract_* sueltas, más las líneas del cliente para el resumen
+    heurístico. fields_fn permite pasar conv_fields memoizado.
+    """
+    campos = fields_fn(conv)
+    return {
+        "email":    campos["email"],
+        "telefono": extract_phone(raw_phone, conv),
+        "rut":      campos["rut"],
+        "renta":    campos["renta"],
+        "lineas_cliente": campos["lineas_cliente"],
+    }
+
 def clean_name(raw: str) -> str:
     # quita emojis y caracteres especiales, capitaliza
     name = re.sub(r'[^\w\s]', '', raw, flags=re.UNICODE)
@@ -277,162 +430,1079 @@ def clean_name(raw: str) -> str:
     return " ".join(w.capitalize() for w in name.split())
 
 
+def lead_memos(maxsize: int = MEMO_MAX_VALUES) -> dict:
+    """
+    Memos acotados de los limpiadores por celda (ver memo.py): las mismas
+    transcripciones de bots y los mismos nombres se repiten miles de veces.
+    Los de conversaciones guardan menos (text_memo_size): cada valor pesa KB.
+    """
+    text_size = text_memo_size(maxsize)
+    return {
+        "parse_chat":  ValueMemo("parse_chat", parse_chat, maxsize=text_size),
+        "conv_fields": ValueMemo("conv_fields", conv_fields, maxsize=text_size),
+        "clean_name":  ValueMemo("clean_name", clean_name, maxsize=maxsize),
+    }
+
+
+# ─────────────────────────────────────────
+# CACHE DE RESÚMENES (SQLite)
+# ─────────────────────────────────────────
+class SummaryCache:
+    """
+    Cache en disco de resúmenes IA, direccionado por contenido: la clave es un
+    hash del prompt completo (plantilla, conversación ya recortada y datos del
+    lead), el modelo y sus opciones. Cambiar cualquiera de ellos invalida la
+    entrada. Es seguro usarlo desde varios workers.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, refresh: bool = False,
+                 max_entries: int = CACHE_MAX_ENTRIES, max_age_days: float = CACHE_MAX_AGE_DAYS):
+        self.refresh = refresh
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS summaries (
+                                key TEXT PRIMARY KEY, summary TEXT NOT NULL,
+                                created REAL NOT NULL, last_used REAL NOT NULL)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON summaries(last_used)")
+        self._db.execute("DELETE FROM summaries WHERE created < ?", (time.time() - self.max_age,))
+        self._db.commit()
+
+    @staticmethod
+    def make_key(prompt: str) -> str:
+        material = json.dumps([OLLAMA_MODEL, TEMPERATURE, NUM_PREDICT, prompt], ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if self.refresh:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return row[0]
+
+    def put(self, key: str, summary: str):
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)",
+                             (key, summary, now, now))
+            self._db.commit()
+
+    def close(self):
+        """Aplica el límite de tamaño (descarta lo menos usado) y cierra."""
+        with self._lock:
+            self._db.execute("""DELETE FROM summaries WHERE key IN (
+                                    SELECT key FROM summaries ORDER BY last_used DESC
+                                    LIMIT -1 OFFSET ?)""", (self.max_entries,))
+            self._db.commit()
+            self._db.close()
+
+
+# ─────────────────────────────────────────
+# PROMPT
+# ─────────────────────────────────────────
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text: str) -> int:
+    """Tokens aproximados sin tokenizer: uno por palabra o signo, más uno cada 6 letras extra."""
+    return sum(1 + (len(t) - 1) // 6 for t in TOKEN_RE.findall(text))
+
+def recortar_tokens(text: str, max_tokens: int) -> str:
+    """Corta text a unos max_tokens (estimados), marcando el corte con […]."""
+    usados = 0
+    for m in TOKEN_RE.finditer(text):
+        usados += 1 + (len(m.group()) - 1) // 6
+        if usados > max_tokens:
+            return text[:m.start()].rstrip() + " […]"
+    return text
+
+
+class PromptBuilder:
+    """
+    Arma el prompt de cada lead con la conversación dentro de un presupuesto
+    de tokens en vez de un corte por caracteres:
+
+      - las líneas BOT que son plantilla (se repiten en TEMPLATE_MIN_LEADS o
+        más leads de la muestra) quedan en sus primeras palabras + "…". La
+        muestra son los primeros sample_leads leads que pasan por learn, a
+        medida que llegan: un mensaje es plantilla apenas alcanza min_leads
+      - las demás líneas BOT se acortan a BOT_LINE_TOKENS
+      - si aun así no cabe, salen primero las líneas BOT más antiguas y luego
+        las del medio (se conservan la primera y las últimas); donde salió
+        texto del cliente queda "[…]"
+
+    Los tokens se estiman (estimate_tokens) y la estimación se calibra con el
+    prompt_eval_count que devuelve Ollama. Con eso también se calcula cuántos
+    tokens de prompt ahorra cada lead frente a la conversación completa
+    cortada en MAX_CONV_CHARS. Es seguro entre workers.
+    """
+
+    def __init__(self, templates: Iterable[str] = (), budget: int = CONV_TOKEN_BUDGET,
+                 sample_leads: int = 0, min_leads: int = TEMPLATE_MIN_LEADS):
+        self.templates = frozenset(templates)
+        self.budget = budget
+        self.sample_leads = sample_leads
+        self.min_leads = min_leads
+        self.sampled = 0
+        self._counts = Counter()
+        self.ratio = 1.0  # tokens reales / estimados, entre 0.5 y 2
+        self.leads = 0
+        self.prompt_tokens = 0
+        self.saved_tokens = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_sample(cls, convs: Iterable[str], min_leads: int = TEMPLATE_MIN_LEADS, **kwargs):
+        """Detecta las plantillas del bot en una muestra de conversaciones parseadas."""
+        counts = Counter()
+        for conv in convs:
+            counts.update({ln[4:].strip() for ln in conv.splitlines() if ln.startswith("BOT:")})
+        return cls((msg for msg, n in counts.items() if msg and n >= min_leads), **kwargs)
+
+    def learn(self, conv: str):
+        """Suma una conversación parseada a la muestra de plantillas, si aún no está completa."""
+        if self.sampled >= self.sample_leads:
+            return
+        mensajes = {ln[4:].strip() for ln in conv.splitlines() if ln.startswith("BOT:")}
+        with self._lock:
+            if self.sampled >= self.sample_leads:
+                return
+            self.sampled += 1
+            self._counts.update(mensajes)
+            nuevas = {msg for msg in mensajes
+                      if msg and msg not in self.templates and self._counts[msg] >= self.min_leads}
+            if nuevas:
+                self.templates = self.templates | nuevas
+            if self.sampled == self.sample_leads:
+                self._counts = Counter()  # Muestra completa: los conteos ya no sirven
+
+    def _linea(self, line: str) -> str:
+        if not line.startswith("BOT:"):
+            return line
+        msg = line[4:].strip()
+        if msg in self.templates:
+            palabras = msg.split()
+            if len(palabras) > TEMPLATE_WORDS:
+                return "BOT: " + " ".join(palabras[:TEMPLATE_WORDS]) + "…"
+            return line
+        return "BOT: " + recortar_tokens(msg, BOT_LINE_TOKENS)
+
+    def conversation(self, conv: str) -> str:
+        lines = [self._linea(ln) for ln in conv.splitlines()]
+        costs = [estimate_tokens(ln) for ln in lines]
+        with self._lock:
+            limite = int(self.budget / self.ratio)
+        total = sum(costs)
+        if total <= limite:
+            return "\n".join(lines)
+
+        # keep: True se queda, None sale sin marca (BOT), False sale con "[…]"
+        keep = [True] * len(lines)
+        # 1. Líneas BOT, de la más antigua a la más nueva
+        for i in range(len(lines)):
+            if total <= limite:
+                break
+            if lines[i].startswith("BOT:"):
+                keep[i] = None
+                total -= costs[i]
+        # 2. Líneas del medio, de la más antigua a la más nueva (primera y última se quedan)
+        kept = [i for i, k in enumerate(keep) if k]
+        for i in kept[1:-1]:
+            if total <= limite:
+                break
+            keep[i] = False
+            total -= costs[i]
+
+        if total > limite and kept:
+            # Quedan mensajes enormes: se corta el más largo
+            j = max((i for i, k in enumerate(keep) if k), key=costs.__getitem__)
+            lines[j] = recortar_tokens(lines[j], max(BOT_LINE_TOKENS, limite - (total - costs[j])))
+
+        out = []
+        for i, line in enumerate(lines):
+            if keep[i]:
+                out.append(line)
+            elif keep[i] is False and (not out or out[-1] != "[…]"):
+                out.append("[…]")
+        return "\n".join(out)
+
+    def build(self, nombre: str, telefono: str, estado: str, conv: str) -> Tuple[str, int, int]:
+        """(prompt, tokens estimados, tokens estimados del prompt con la conversación completa)."""
+        prompt = PROMPT_TEMPLATE.format(nombre=nombre, telefono=telefono, estado=estado,
+                                        conv=self.conversation(conv)).strip()
+        completo = PROMPT_TEMPLATE.format(nombre=nombre, telefono=telefono, estado=estado,
+                                          conv=conv[:MAX_CONV_CHARS]).strip()
+        return prompt, estimate_tokens(prompt), estimate_tokens(completo)
+
+    def observe(self, estimated: int, baseline: int, prompt_eval_count, leads: int = 1) -> float:
+        """
+        Calibra con los tokens reales del prompt y retorna los tokens ahorrados
+        por los leads del prompt (más de uno si va empaquetado, ver
+        SummaryPacker). Si Ollama reusó el prefijo en caché (las instrucciones),
+        prompt_eval_count cuenta solo el resto y no sirve para calibrar.
+        """
+        if not estimated or not isinstance(prompt_eval_count, int) or prompt_eval_count <= 0:
+            return 0.0
+        real_por_estimado = prompt_eval_count / estimated
+        with self._lock:
+            if real_por_estimado >= 0.5:
+                self.ratio = min(2.0, 0.9 * self.ratio + 0.1 * real_por_estimado)
+            saved = (baseline - estimated) * self.ratio
+            self.leads += leads
+            self.prompt_tokens += prompt_eval_count
+            self.saved_tokens += saved
+        return saved
+
+
+# ─────────────────────────────────────────
+# CONVERSACIONES REPETIDAS
+# ─────────────────────────────────────────
+# Emojis, modificadores de tono, selectores de variación y el ZWJ que los une
+EMOJI_RE = re.compile("[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\uFE0E\uFE0F\u200D]")
+
+def conv_group_key(conv: str, estado: str, nombre: str, telefono: str) -> str:
+    """
+    Clave de grupo: la conversación sin emojis y con los espacios colapsados,
+    el estado, y si el lead tiene nombre y teléfono (el prompt los incluye,
+    así que un resumen con "No informado" no se reparte a quien sí los tiene).
+    """
+    normalizada = " ".join(EMOJI_RE.sub("", conv).split())
+    material = f"{estado}\x1e{bool(nombre)}{bool(telefono)}\x1e{normalizada}"
+    return hashlib.sha1(material.encode("utf-8")).hexdigest()
+
+def _palabra_re(texto: str, flags: int = 0) -> re.Pattern:
+    return re.compile(rf"(?<!\w){re.escape(texto)}(?!\w)", flags)
+
+def _telefono_re(telefono: str) -> Optional[re.Pattern]:
+    """Los últimos 8 dígitos del teléfono, con o sin espacios, puntos o guiones entre ellos."""
+    digitos = re.sub(r"\D", "", telefono)[-8:]
+    if len(digitos) < 8:
+        return None
+    return re.compile(r"(?<!\d)" + r"[\s.()-]*".join(digitos) + r"(?!\d)")
+
+def personalizar(texto: str, de: Tuple[str, str], a: Tuple[str, str]) -> Optional[str]:
+    """
+    Cambia el nombre y teléfono del lead que generó el resumen por los de otro
+    lead, como palabras completas. Retorna None si no se puede hacer sin
+    riesgo: el modelo no copió textual el nombre o teléfono del autor, o tras
+    el cambio sigue apareciendo algo suyo (el nombre de pila solo, el teléfono
+    con otro formato). En ese caso el lead se resume por su cuenta.
+    """
+    for viejo, nuevo in zip(de, a):
+        if not viejo or viejo == nuevo:
+            continue
+        patron = _palabra_re(viejo)
+        if not patron.search(texto):
+            return None
+        texto = patron.sub(lambda _: nuevo, texto)
+
+    (nombre_de, telefono_de), (nombre_a, telefono_a) = de, a
+    if nombre_de != nombre_a:
+        propias = {p.lower() for p in nombre_a.split()}
+        for palabra in nombre_de.split():
+            if (len(palabra) >= 3 and palabra.lower() not in propias
+                    and _palabra_re(palabra, re.IGNORECASE).search(texto)):
+                return None
+    if telefono_de != telefono_a:
+        patron = _telefono_re(telefono_de)
+        if patron is not None and patron.search(texto):
+            return None
+    return texto
+
+
+class SummaryCoalescer:
+    """
+    Agrupa, dentro de una corrida, los leads cuya conversación parseada es la
+    misma salvo espacios y emojis (y con el mismo estado): el primero del grupo
+    llama a Ollama y los demás esperan y reciben ese resumen, con su propio
+    nombre y teléfono en vez de los del primero (personalizar). Si el primero
+    no obtuvo resumen IA, o el resumen no se puede personalizar sin dejar
+    datos del primero, los demás lo intentan por su cuenta. summarize es quien
+    resume (ollama_summary o SummaryPacker.summary). Es seguro entre workers.
+    """
+
+    def __init__(self, maxsize: int = COALESCE_MAX_GROUPS, summarize: Optional[Callable] = None):
+        self.maxsize = maxsize
+        self.summarize = summarize or ollama_summary
+        self.saved = 0
+        self._groups = OrderedDict()
+        self._lock = threading.Lock()
+
+    def summary(self, session: requests.Session, nombre: str, telefono: str, tag_estado: str,
+                conv: str, cache: Optional["SummaryCache"] = None,
+                metrics: Optional[RunMetrics] = None, guard: Optional[LLMGuard] = None,
+                builder: Optional[PromptBuilder] = None) -> Tuple[str, bool]:
+        """Igual que ollama_summary, una llamada por grupo."""
+        if not conv.strip():
+            return self.summarize(session, nombre, telefono, tag_estado, conv, cache, metrics, guard, builder)
+        key = conv_group_key(conv, tag_estado, nombre, telefono)
+        with self._lock:
+            grupo = self._groups.get(key)
+            primero = grupo is None
+            if primero:
+                grupo = self._groups[key] = Future()
+                if len(self._groups) > self.maxsize:
+                    self._groups.popitem(last=False)
+            else:
+                self._groups.move_to_end(key)
+        if primero:
+            try:
+                resultado = self.summarize(session, nombre, telefono, tag_estado, conv, cache, metrics,
+                                           guard, builder)
+            except BaseException as e:
+                grupo.set_exception(e)
+                raise
+            grupo.set_result((resultado, (nombre or "No informado", telefono)))
+            return resultado
+
+        try:
+            (texto, por_ia), autor = grupo.result()
+        except Exception:
+            por_ia = False
+        if por_ia:
+            texto = personalizar(texto, autor, (nombre or "No informado", telefono))
+        if not por_ia or texto is None:
+            return self.summarize(session, nombre, telefono, tag_estado, conv, cache, metrics, guard, builder)
+        with self._lock:
+            self.saved += 1
+        if metrics is not None:
+            metrics.incr("llm_calls_saved")
+        return texto, True
+
+
+# ─────────────────────────────────────────
+# VARIOS LEADS POR LLAMADA (--pack)
+# ─────────────────────────────────────────
+# "### LEAD 3", "**LEAD 3:**", "LEAD 3"... en una línea propia
+PACK_HEADER_RE = re.compile(r"^[#*\s]*LEAD\s+(\d+)\W*$", re.IGNORECASE | re.MULTILINE)
+
+def es_corta(conv: str) -> bool:
+    """Si la conversación puede ir empaquetada con otras (ver PACK_MAX_CLIENT_LINES)."""
+    lineas = sum(1 for ln in conv.splitlines() if ln.startswith("CLIENTE:"))
+    return 0 < lineas <= PACK_MAX_CLIENT_LINES
+
+def separar_resumenes(texto: str, n: int) -> dict:
+    """
+    Parte la respuesta de un prompt empaquetado en {id: resumen} para los ids
+    1..n. Los ids fuera de rango, repetidos o con sección vacía no se incluyen.
+    """
+    texto = texto.replace("FIN", "")
+    marcas = list(PACK_HEADER_RE.finditer(texto))
+    resumenes = {}
+    for j, m in enumerate(marcas):
+        fin = marcas[j + 1].start() if j + 1 < len(marcas) else len(texto)
+        lead_id = int(m.group(1))
+        seccion = texto[m.end():fin].strip()
+        if 1 <= lead_id <= n and seccion and lead_id not in resumenes:
+            resumenes[lead_id] = seccion
+    return resumenes
+
+
+class SummaryPacker:
+    """
+    Resume las conversaciones cortas de a varias por llamada a Ollama: cada
+    lead va en su sección "### LEAD n" y la respuesta se parte de vuelta por
+    lead (separar_resumenes). Los leads que faltan en la respuesta se vuelven
+    a resumir por separado; si la llamada misma falla, van a la heurística
+    (ollama_generate ya reintentó). Las conversaciones largas van directo a
+    ollama_summary. Si el modelo no respeta el formato (PACK_MAX_UNPARSED
+    respuestas seguidas sin secciones), se deja de empaquetar.
+
+    El primer lead de un lote espera hasta wait segundos a que otros workers
+    lo llenen; el que lo llena (o el primero, al vencer la espera) hace la
+    llamada. Necesita --workers >= max_leads. Es seguro entre workers.
+    """
+
+    def __init__(self, max_leads: int, wait: float = PACK_WAIT_SECONDS):
+        self.max_leads = max_leads
+        self.wait = wait
+        self.requests = 0
+        self.packed = 0
+        self.retried = 0
+        self._sin_formato = 0
+        self._lote = []
+        self._cond = threading.Condition()
+
+    def summary(self, session: requests.Session, nombre: str, telefono: str, tag_estado: str,
+                conv: str, cache: Optional["SummaryCache"] = None,
+                metrics: Optional[RunMetrics] = None, guard: Optional[LLMGuard] = None,
+                builder: Optional[PromptBuilder] = None) -> Tuple[str, bool]:
+        """Igual que ollama_summary; las conversaciones cortas comparten llamada."""
+        if self.max_leads < 2 or not es_corta(conv):
+            return ollama_summary(session, nombre, telefono, tag_estado, conv, cache, metrics, guard, builder)
+        builder = builder or PromptBuilder()
+        recortada = builder.conversation(conv)
+        if estimate_tokens(recortada) > PACK_MAX_TOKENS:
+            return ollama_summary(session, nombre, telefono, tag_estado, conv, cache, metrics, guard, builder)
+
+        # Mismo cache que ollama_summary: la clave es el prompt individual del lead
+        nombre_p, estado = nombre or "No informado", tag_estado or "Sin clasificar"
+        individual, _, completos = builder.build(nombre_p, telefono, estado, conv)
+        key = None
+        if cache is not None:
+            key = cache.make_key(individual)
+            cached = cache.get(key)
+            if cached:
+                return cached, True
+
+        lead = {"args": (nombre, telefono, tag_estado, conv), "key": key, "future": Future(),
+                "completos": completos,
+                "seccion": dict(nombre=nombre_p, telefono=telefono, estado=estado, conv=recortada)}
+        with self._cond:
+            lote = self._lote
+            lote.append(lead)
+            lleno = len(lote) >= self.max_leads
+            if lleno:
+                self._lote = []
+                self._cond.notify_all()
+            elif len(lote) == 1:
+                # Primero del lote: espera a que otro lo llene o vence la espera
+                if not self._cond.wait_for(lambda: self._lote is not lote, timeout=self.wait):
+                    self._lote = []
+                    lleno = True
+        if lleno:
+            self._enviar(session, lote, cache, metrics, guard, builder)
+        return lead["future"].result()
+
+    def _enviar(self, session: requests.Session, lote: list, cache: Optional["SummaryCache"],
+                metrics: Optional[RunMetrics], guard: Optional[LLMGuard], builder: PromptBuilder):
+        try:
+            if len(lote) == 1:
+                lead = lote[0]
+                lead["future"].set_result(ollama_summary(session, *lead["args"], cache, metrics, guard, builder))
+                return
+
+            secciones = "\n".join(PACK_LEAD_TEMPLATE.format(id=n, **lead["seccion"])
+                                  for n, lead in enumerate(lote, 1))
+            prompt = PACK_TEMPLATE.format(n=len(lote), leads=secciones).strip()
+            data = ollama_generate(session, prompt, NUM_PREDICT * len(lote), metrics, guard, leads=len(lote))
+            resumenes = {}
+            if data is not None:
+                # Ahorro frente a un prompt completo por lead, como en ollama_summary
+                saved = builder.observe(estimate_tokens(prompt), sum(lead["completos"] for lead in lote),
+                                        data.get("prompt_eval_count"), leads=len(lote))
+                if metrics is not None:
+                    metrics.incr("prompt_tokens_saved", round(saved))
+                resumenes = separar_resumenes(data.get("response") or "", len(lote))
+                with self._cond:
+                    self.requests += 1
+                    self.packed += len(resumenes)
+                    self.retried += len(lote) - len(resumenes)
+                    self._sin_formato = 0 if resumenes else self._sin_formato + 1
+                    if self._sin_formato == PACK_MAX_UNPARSED:
+                        self.max_leads = 1
+                        print(f"⚠️  {PACK_MAX_UNPARSED} respuestas empaquetadas sin el formato pedido: "
+                              f"se sigue de a un lead por llamada.")
+                if metrics is not None:
+                    metrics.incr("llm_pack_requests")
+                    metrics.incr("llm_pack_leads", len(resumenes))
+
+            for n, lead in enumerate(lote, 1):
+                texto = resumenes.get(n)
+                if texto:
+                    if cache is not None:
+                        cache.put(lead["key"], texto)
+                    lead["future"].set_result((texto, True))
+                elif data is None:
+                    lead["future"].set_result((resumen_heuristico(lead["args"][3]), False))
+                else:
+                    # La respuesta no trajo este lead: se resume solo
+                    if metrics is not None:
+                        metrics.incr("llm_pack_retried")
+                    lead["future"].set_result(ollama_summary(session, *lead["args"], cache, metrics,
+                                                             guard, builder))
+        except BaseException as e:
+            for lead in lote:
+                if not lead["future"].done():
+                    lead["future"].set_exception(e)
+            raise
+
+
 # ─────────────────────────────────────────
 # RESUMEN CON OLLAMA
 # ─────────────────────────────────────────
 def ollama_summary(session: requests.Session, nombre: str, telefono: str,
-                   tag_estado: str, conv: str) -> Tuple[str, bool]:
+                   tag_estado: str, conv: str,
+                   cache: Optional["SummaryCache"] = None,
+                   metrics: Optional[RunMetrics] = None,
+                   guard: Optional[LLMGuard] = None,
+                   builder: Optional[PromptBuilder] = None) -> Tuple[str, bool]:
     """
     Retorna (texto_resumen, fue_por_ia).
+    El prompt lo arma builder (ver PromptBuilder; sin plantillas si no se pasa).
+    Si hay cache, se consulta antes de llamar a Ollama y se guarda el resultado.
+    La llamada la hace ollama_generate (métricas, reintentos y breaker con guard).
     Si falla, devuelve resumen heurístico con fue_por_ia=False.
     """
     if not conv.strip():
         return "Sin conversación registrada.", False
 
-    prompt = f"""Eres un asistente de ventas inmobiliarias. Redacta un resumen BREVE y DIRECTO para un ejecutivo humano.
-
-INSTRUCCIONES:
-- Analiza solo lo que dice CLIENTE:, el BOT: es contexto.
-- Sin JSON, sin tablas, sin adornos. Solo texto plano útil.
-- 3 secciones cortas: Resumen, Datos Clave, Siguiente Paso.
-
-LEAD:
-- Nombre: {nombre or 'No informado'}
-- Teléfono: {telefono}
-- Estado: {tag_estado or 'Sin clasificar'}
+    nombre = nombre or 'No informado'
+    estado = tag_estado or 'Sin clasificar'
+    builder = builder or PromptBuilder()
+    prompt, estimados, completos = builder.build(nombre, telefono, estado, conv)
+
+    key = None
+    if cache is not None:
+        key = cache.make_key(prompt)
+        cached = cache.get(key)
+        if cached:
+            return cached, True
+
+    data = ollama_generate(session, prompt, NUM_PREDICT, metrics, guard)
+    if data is not None:
+        saved = builder.observe(estimados, completos, data.get("prompt_eval_count"))
+        if metrics is not None:
+            metrics.incr("prompt_tokens_saved", round(saved))
+        text = (data.get("response") or "").replace("FIN", "").strip()
+        if text:
+            if cache is not None:
+                cache.put(key, text)
+            return text, True
 
-CONVERSACIÓN:
-\"\"\"{conv}\"\"\"
+    return resumen_heuristico(conv), False
 
-FIN
-""".strip()
 
+def ollama_generate(session: requests.Session, prompt: str, num_predict: int,
+                    metrics: Optional[RunMetrics] = None, guard: Optional[LLMGuard] = None,
+                    leads: int = 1) -> Optional[dict]:
+    """
+    Una llamada a /api/generate; retorna la respuesta JSON o None si no hubo.
+    Si hay metrics, registra latencia y tokens (eval_count, eval_duration...).
+    Con guard, el timeout de lectura se adapta a la latencia observada, los
+    errores transitorios se reintentan con jitter y, con el circuito abierto,
+    no se llama. Sin guard, un intento con TIMEOUT. leads es cuántos leads
+    resume la llamada: el timeout se alarga en proporción y la latencia se
+    observa por lead.
+    """
     payload = {
         "model": OLLAMA_MODEL, "prompt": prompt, "stream": False,
         "keep_alive": KEEP_ALIVE,
-        "options": {"temperature": TEMPERATURE, "num_predict": NUM_PREDICT, "stop": ["FIN"]},
+        "options": {"temperature": TEMPERATURE, "num_predict": num_predict, "stop": ["FIN"]},
     }
 
-    try:
-        r = session.post(OLLAMA_URL, json=payload, timeout=TIMEOUT)
-        r.raise_for_status()
-        text = (r.json().get("response") or "").replace("FIN", "").strip()
-        if text:
-            return text, True
-    except Exception as e:
-        print(f"   ⚠️  Ollama falló: {e}")
+    intentos = 1 + (guard.retries if guard is not None else 0)
+    fallo = False
+    for intento in range(intentos):
+        if guard is not None and not guard.breaker.allow():
+            if not fallo and metrics is not None:
+                metrics.incr("llm_breaker_skipped")
+            break
+        try:
+            start = time.perf_counter()
+            r = session.post(OLLAMA_URL, json=payload,
+                             timeout=guard.timeout.timeout(leads) if guard is not None else TIMEOUT)
+            r.raise_for_status()
+            data = r.json()
+            latency = time.perf_counter() - start
+        except Exception as e:
+            print(f"   ⚠️  Ollama falló: {e}")
+            if metrics is not None:
+                metrics.incr("llm_errors")
+            fallo = True
+            if guard is None or not es_transitorio(e) or intento + 1 == intentos:
+                break
+            if guard.breaker.state != guard.breaker.CLOSED:
+                break  # Era la llamada de prueba (o el circuito se abrió): no se reintenta
+            if metrics is not None:
+                metrics.incr("llm_retries")
+            time.sleep(retry_delay(intento))
+            continue
+
+        if guard is not None:
+            guard.timeout.observe(latency / leads)
+            guard.breaker.success()
+        if metrics is not None:
+            metrics.observe_llm(latency, data)
+        return data
+
+    if fallo and guard is not None:
+        # Una falla por llamada, ya agotados los reintentos (o la llamada de prueba)
+        guard.breaker.failure()
+    return None
+
 
-    # Fallback heurístico
+def resumen_heuristico(conv: str) -> str:
+    """Resumen sin LLM: los últimos mensajes del cliente (del mismo corte que la extracción de campos)."""
+    conv = conv[:MAX_CONV_CHARS]
     client_lines = [ln for ln in conv.splitlines() if ln.startswith("CLIENTE:")]
     snippet = " | ".join(ln.replace("CLIENTE:", "").strip() for ln in client_lines[-4:])
     if not snippet:
         snippet = conv[:300]
-    return f"Resumen automático: {snippet[:350]}", False
+    return f"Resumen automático: {snippet[:350]}"
+
+
+def es_transitorio(error: Exception) -> bool:
+    """Errores que vale la pena reintentar: conexión, timeout, HTTP 429 o 5xx."""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return False
+
+
+# ─────────────────────────────────────────
+# PROCESAMIENTO POR LEAD
+# ─────────────────────────────────────────
+def process_lead(session: requests.Session, row, use_llm: bool,
+                 cache: Optional[SummaryCache] = None,
+                 metrics: Optional[RunMetrics] = None, memos: Optional[dict] = None,
+                 coalescer: Optional[SummaryCoalescer] = None, guard: Optional[LLMGuard] = None,
+                 builder: Optional[PromptBuilder] = None, packer: Optional["SummaryPacker"] = None) -> dict:
+    """
+    Procesa una fila de read_csv_envuelto y retorna la fila normalizada.
+    Con memos (ver lead_memos) los limpiadores se calculan una vez por valor,
+    con coalescer las conversaciones repetidas se resumen una vez, guard
+    acota las llamadas a Ollama, builder arma el prompt (ver ollama_summary)
+    y con packer las conversaciones cortas comparten llamada (el coalescer
+    ya lo usa si lo recibió al crearse).
+    """
+    metrics = metrics or RunMetrics("ai_normalizer")
+    memos = memos or {}
+    parse = memos.get("parse_chat", parse_chat)
+    fields_fn = memos.get("conv_fields", conv_fields)
+    name_fn = memos.get("clean_name", clean_name)
+    nombre_raw   = str(row.get("nombre_usuario", "")).strip()
+    telefono_raw = str(row.get("telefono_raw", "")).strip()
+    project_tag  = str(row.get("project_tag", "")).strip()
+    tag_estado   = str(row.get("tag_estado", "")).strip()
+    trans_raw    = str(row.get("transcripcion", "")).strip()
+
+    # 1. Parsear la conversación
+    with metrics.stage("parse"):
+        conv = parse(trans_raw)
+    if use_llm and builder is not None:
+        builder.learn(conv)
+
+    # 2. Extraer campos estructurados (del inicio de la conversación; el
+    #    prompt la recorta por tokens)
+    with metrics.stage("extract"):
+        nombre    = name_fn(nombre_raw)
+        campos    = extract_fields(telefono_raw, conv[:MAX_CONV_CHARS], fields_fn)
+    email     = campos["email"]
+    telefono  = campos["telefono"]
+    renta     = campos["renta"]
+    rut       = campos["rut"]
+    proyecto  = project_tag if project_tag and project_tag.lower() not in ('nan', 'none', '') else ""
+
+    # 3. Generar resumen con IA (o heurística)
+    if use_llm:
+        with metrics.stage("summarize"):
+            if coalescer is not None:
+                summarize = coalescer.summary
+            else:
+                summarize = packer.summary if packer is not None else ollama_summary
+            resumen, por_ia = summarize(session, nombre, telefono, tag_estado, conv, cache, metrics,
+                                        guard, builder)
+    else:
+        resumen = " | ".join(campos["lineas_cliente"][-4:])[:400] or "Sin conversación."
+        por_ia = False
+
+    # 4. Formatear observacion con icono 🤖 si fue procesado por IA
+    if por_ia:
+        # Incluir estado si es relevante
+        estado_label = f"[{tag_estado}] " if tag_estado and tag_estado.lower() not in ('', 'nan') else ""
+        observacion = f"🤖 {estado_label}{resumen}"
+    else:
+        observacion = resumen
+
+    # 5. Limpiar caracteres especiales no deseados del nombre
+    nombre_final = nombre if nombre else nombre_raw[:50]
+
+    # 6. Determinar flags adicionales para el CRM (es_caliente y es_ia)
+    es_caliente = "true" if es_lead_caliente(tag_estado) else "false"
+    es_ia = "true" if por_ia else "false"
+
+    return {
+        "nombre":      nombre_final,
+        "email":       email,
+        "telefono":    telefono,
+        "rut":         rut,
+        "renta":       renta,
+        "proyecto":    proyecto,
+        "observacion": observacion,
+        "es_ia":       es_ia,
+        "es_caliente": es_caliente
+    }
+
+
+def map_en_orden(fn: Callable, items: Iterable, workers: int) -> Iterator:
+    """
+    Aplica fn a cada item con un pool acotado de hilos y entrega los
+    resultados en el mismo orden de entrada. Con workers=1 es secuencial.
+    """
+    if workers <= 1:
+        for item in items:
+            yield fn(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pendientes = deque()
+        for item in items:
+            pendientes.append(pool.submit(fn, item))
+            # Limita los leads en vuelo para no encolar todo el archivo
+            if len(pendientes) >= workers * 2:
+                yield pendientes.popleft().result()
+        while pendientes:
+            yield pendientes.popleft().result()
+
+
+# ─────────────────────────────────────────
+# PRIORIDAD Y PLAZO (--priority / --deadline / --backfill)
+# ─────────────────────────────────────────
+BACKFILL_SUFFIX = ".backfill"
+
+def es_lead_caliente(tag_estado: str) -> bool:
+    return "🔥" in tag_estado or "caliente" in tag_estado.lower()
+
+def prioridad(row) -> int:
+    """Orden de resumen: 0 para los leads calientes, 1 para el resto."""
+    return 0 if es_lead_caliente(str(row.get("tag_estado", "")).strip()) else 1
+
+def parse_duracion(texto: str) -> float:
+    """'90' o '90s', '45m', '2h' -> segundos."""
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smh]?)\s*", texto.lower())
+    if not m:
+        raise argparse.ArgumentTypeError(f"duración inválida: {texto} (ej: 900, 45m, 2h)")
+    return float(m.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600}[m.group(2)]
+
+def load_backfill(path: str) -> dict:
+    """
+    Leads marcados para backfill: {indice: (huella, fila de salida)}. Con
+    --incremental la fila de salida no es la de entrada (se omiten leads).
+    """
+    marcados = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                marcados[entry["i"]] = (entry["fp"], entry.get("o", entry["i"]))
+    return marcados
+
+def write_backfill(path: str, marcados: dict):
+    """Reescribe la lista de backfill; sin pendientes, la borra."""
+    if not marcados:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        for i in sorted(marcados):
+            fp, fila = marcados[i]
+            f.write(json.dumps({"i": i, "fp": fp, "o": fila}) + "\n")
+
+
+# ─────────────────────────────────────────
+# JOURNAL DE AVANCE (checkpoint / --resume)
+# ─────────────────────────────────────────
+def lead_fingerprint(row) -> str:
+    """Huella de la fila de entrada, para no retomar un lead que cambió."""
+    material = json.dumps({k: str(v) for k, v in dict(row).items()}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(material.encode("utf-8")).hexdigest()
+
+def load_journal(path: str) -> dict:
+    """
+    Lee el journal append-only (JSON por línea) y retorna {indice: (huella, fila)}.
+    Una última línea truncada por un corte abrupto se ignora, y los leads que
+    quedaron con heurística por el plazo (bf) se vuelven a procesar.
+    """
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                if entry.get("bf"):
+                    done.pop(entry["i"], None)
+                    continue
+                done[entry["i"]] = (entry["fp"], entry["row"])
+            except Exception:
+                continue
+    return done
 
 
 # ─────────────────────────────────────────
 # MAIN
 # ─────────────────────────────────────────
-def main():
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Normalizador con IA para CSVs de chat")
     parser.add_argument("input_csv", help="Ruta al CSV de entrada (ej: prueba1.csv)")
     parser.add_argument("--output", help="Ruta del CSV de salida (por defecto: <input>_ai_normalized.csv)")
     parser.add_argument("--no-llm", action="store_true", help="Saltar Ollama y usar solo heurística")
-    args = parser.parse_args()
-
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Resúmenes Ollama en paralelo (usar <= OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--no-cache", action="store_true", help="No leer ni guardar resúmenes en cache")
+    parser.add_argument("--refresh-cache", action="store_true",
+                        help="Ignorar el cache al leer, pero guardar los resúmenes nuevos")
+    parser.add_argument("--cache-path", default=CACHE_PATH, help="Archivo SQLite del cache de resúmenes")
+    parser.add_argument("--no-coalesce", action="store_true",
+                        help="Resumir cada lead por separado aunque su conversación se repita")
+    parser.add_argument("--pack", type=int, default=1, metavar="N",
+                        help=f"Resumir hasta N conversaciones cortas (<= {PACK_MAX_CLIENT_LINES} mensajes "
+                             "del cliente) por llamada a Ollama; necesita --workers >= N")
+    parser.add_argument("--resume", action="store_true",
+                        help="Retomar desde el journal de una corrida anterior interrumpida")
+    parser.add_argument("--report-json",
+                        help="Reporte JSON de tiempos y métricas LLM (por defecto: <output>_report.json)")
+    parser.add_argument("--prom-textfile", help="Escribir también métricas en formato Prometheus (textfile)")
+    parser.add_argument("--copy-output", help="Escribir también un archivo COPY para la tabla leads")
+    parser.add_argument("--pg-dsn", help="Cargar los leads directo a Postgres con COPY FROM STDIN")
+    parser.add_argument("--pg-table", default="leads", help="Tabla destino de --pg-dsn")
+    parser.add_argument("--pg-batch-rows", type=int, default=PG_BATCH_ROWS,
+                        help="Filas por transacción al cargar a Postgres")
+    parser.add_argument("--memo-size", type=int, default=MEMO_MAX_VALUES,
+                        help="Valores distintos que recuerda cada limpiador (0: sin memo)")
+    parser.add_argument("--priority", action="store_true",
+                        help="Resumir primero los leads calientes (🔥/caliente); la salida mantiene el orden")
+    parser.add_argument("--deadline", type=parse_duracion,
+                        help="Tiempo máximo para resúmenes IA (ej: 45m, 2h); implica --priority. "
+                             "Lo que no alcance queda con heurística y marcado para --backfill")
+    parser.add_argument("--backfill", action="store_true",
+                        help="Resumir con IA solo los leads marcados por --deadline y actualizar esas filas")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Procesar y escribir solo los leads nuevos o cambiados desde corridas anteriores")
+    parser.add_argument("--index-path", default=INDEX_PATH, help="Índice de leads de --incremental")
+    return parser
+
+
+def run(args: argparse.Namespace, session: Optional[requests.Session] = None,
+        memos: Optional[dict] = None) -> int:
+    """
+    Normaliza args.input_csv según las opciones de build_parser y retorna el
+    código de salida. El modo servicio (normalizer_service.py) pasa una sesión
+    con Ollama ya arrancado y calentado, que se reutiliza entre trabajos (y
+    que run no modifica: su pool lo dimensiona quien la crea), y memos que se
+    conservan entre archivos.
+    """
     if not os.path.exists(args.input_csv):
         print(f"❌ Archivo no encontrado: {args.input_csv}")
-        sys.exit(1)
+        return 1
 
     output_path = args.output or args.input_csv.replace(".csv", "_ai_normalized.csv")
 
-    session = requests.Session()
-
-    if not args.no_llm:
-        ensure_ollama(session)
-        warmup(session)
-
-    print(f"\n📂 Leyendo: {args.input_csv}")
-    df = read_csv_envuelto(args.input_csv)
-    print(f"   {len(df)} leads encontrados.\n")
-
-    results = []
-    total = len(df)
-
-    for i, row in df.iterrows():
-        nombre_raw   = str(row.get("nombre_usuario", "")).strip()
-        telefono_raw = str(row.get("telefono_raw", "")).strip()
-        project_tag  = str(row.get("project_tag", "")).strip()
-        tag_estado   = str(row.get("tag_estado", "")).strip()
-        trans_raw    = str(row.get("transcripcion", "")).strip()
-
-        # 1. Parsear la conversación
-        conv = parse_chat(trans_raw)
-
-        # 2. Extraer campos estructurados
-        nombre    = clean_name(nombre_raw)
-        email     = extract_email(conv)
-        telefono  = extract_phone(telefono_raw, conv)
-        renta     = extract_renta(conv)
-        rut       = extract_rut(conv)
-        proyecto  = project_tag if project_tag and project_tag.lower() not in ('nan', 'none', '') else ""
-
-        # 3. Generar resumen con IA (o heurística)
-        if not args.no_llm:
-            resumen, por_ia = ollama_summary(session, nombre, telefono, tag_estado, conv)
-        else:
-            client_lines = [ln.replace("CLIENTE:", "").strip()
-                            for ln in conv.splitlines() if ln.startswith("CLIENTE:")]
-            resumen = " | ".join(client_lines[-4:])[:400] or "Sin conversación."
-            por_ia = False
-
-        # 4. Formatear observacion con icono 🤖 si fue procesado por IA
-        if por_ia:
-            # Incluir estado si es relevante
-            estado_label = f"[{tag_estado}] " if tag_estado and tag_estado.lower() not in ('', 'nan') else ""
-            observacion = f"🤖 {estado_label}{resumen}"
-        else:
-            observacion = resumen
-
-        # 5. Limpiar caracteres especiales no deseados del nombre
-        nombre_final = nombre if nombre else nombre_raw[:50]
-
-        # 6. Determinar flags adicionales para el CRM (es_caliente y es_ia)
-        es_caliente = "true" if "🔥" in tag_estado or "caliente" in tag_estado.lower() else "false"
-        es_ia = "true" if por_ia else "false"
-
-        results.append({
-            "nombre":      nombre_final,
-            "email":       email,
-            "telefono":    telefono,
-            "rut":         rut,
-            "renta":       renta,
-            "proyecto":    proyecto,
-            "observacion": observacion,
-            "es_ia":       es_ia,
-            "es_caliente": es_caliente
-        })
-
-        status = "🤖 IA" if por_ia else "⚙️  heurística"
-        print(f"[{i+1:02d}/{total}] {nombre_final:<25} {telefono:<15} {status}")
-
-    # Guardar CSV normalizado
-    final_df = pd.DataFrame(results)
-    final_df.to_csv(output_path, index=False, encoding="utf-8")
+    use_llm = not args.no_llm
+    workers = max(1, args.workers) if use_llm else 1
+
+    if session is None:
+        session = ollama_session(workers)
+        if use_llm:
+            ensure_ollama(session)
+            warmup(session)
+
+    print(f"\n📂 Leyendo: {args.input_csv}\n")
+    # Los leads se parsean a medida que se consumen: lectura, extracción y
+    # resumen se solapan en vez de esperar a cargar el archivo completo.
+    metrics = RunMetrics("ai_normalizer")
+    registros = metrics.timed_iter("read", iter_csv_envuelto(args.input_csv))
+
+    if workers > 1:
+        print(f"⚡ Resumiendo con {workers} workers en paralelo.\n")
+
+    cache = None
+    if use_llm and not args.no_cache:
+        cache = SummaryCache(args.cache_path, refresh=args.refresh_cache)
+
+    memos = memos if memos is not None else lead_memos(args.memo_size)
+    memo_inicio = {name: (memo.hits, memo.misses) for name, memo in memos.items()}
+    packer = None
+    if use_llm and args.pack > 1:
+        if args.pack > workers:
+            print(f"⚠️  --pack {args.pack} necesita --workers >= {args.pack}; "
+                  f"los lotes serán de a lo más {workers}.")
+        packer = SummaryPacker(min(args.pack, workers))
+        if packer.max_leads > 1:
+            print(f"📦 Conversaciones cortas de a {packer.max_leads} por llamada a Ollama.\n")
+    # Las conversaciones repetidas se agrupan solo dentro de esta corrida
+    coalescer = None
+    if use_llm and not args.no_coalesce:
+        coalescer = SummaryCoalescer(summarize=packer.summary if packer is not None else None)
+    guard = LLMGuard(*TIMEOUT, MIN_READ_TIMEOUT, LLM_RETRIES, BREAKER_FAILURES,
+                     BREAKER_PROBE_SECONDS) if use_llm else None
+    # Las plantillas del bot se aprenden de los primeros leads a medida que
+    # se procesan (process_lead), sin juntar una muestra antes del primero
+    builder = PromptBuilder(sample_leads=TEMPLATE_SAMPLE_LEADS) if use_llm else None
+
+    # Con --deadline, pasado el plazo los leads que quedan van con heurística
+    # y se marcan para un --backfill posterior
+    limite = time.monotonic() + args.deadline if args.deadline else None
+
+    def procesar(item):
+        i, fp, row = item
+        llm = use_llm and (limite is None or time.monotonic() < limite)
+        return (i, fp, process_lead(session, row, llm, cache, metrics, memos, coalescer, guard, builder,
+                                    packer),
+                use_llm and not llm)
+
+    if args.backfill:
+        if args.copy_output:
+            print("❌ --copy-output no aplica a --backfill (usa --pg-dsn para actualizar la base)")
+            return 1
+        try:
+            return run_backfill(args, output_path, procesar, workers, metrics)
+        finally:
+            if cache is not None:
+                cache.close()
+
+    # Journal: cada lead terminado se agrega de inmediato, así un corte no pierde el avance
+    journal_path = output_path + ".journal"
+    done = load_journal(journal_path) if args.resume else {}
+    por_indice = {}
+    retomados = 0
+
+    # --incremental: los leads cuya huella ya está en el índice no se procesan
+    # ni se escriben (por_indice[i] = None); los escritos se registran al final
+    index = LeadIndex(args.index_path, scope="ai_normalizer") if args.incremental else None
+    vistos = set()
+    indexar = []
+    omitidos = 0
+
+    def pendientes():
+        nonlocal retomados, omitidos
+        for i, row in enumerate(registros):
+            fp = lead_fingerprint(row)
+            if index is not None:
+                if fp in vistos or index.seen([fp]):
+                    por_indice[i] = None
+                    omitidos += 1
+                    continue
+                vistos.add(fp)
+            if i in done and done[i][0] == fp:
+                por_indice[i] = done[i][1]
+                retomados += 1
+                if index is not None:
+                    indexar.append((fp, claves_lead(done[i][1])))
+            else:
+                yield i, fp, row
+
+    items = pendientes()
+    if args.priority or limite is not None:
+        # Para ordenar hay que leer el archivo completo; la salida sigue en el orden original
+        items = sorted(items, key=lambda item: prioridad(item[2]))
+        calientes = sum(1 for item in items if prioridad(item[2]) == 0)
+        print(f"🔥 {calientes} leads calientes se resumen primero.\n")
+    procesados = map_en_orden(procesar, items, workers)
+    backfill = {}
+
+    # La salida se escribe fila a fila con el módulo csv (mismo formato que
+    # DataFrame.to_csv), en orden, a un temporal que se renombra al final.
+    # De los leads solo se guardan los primeros para el preview y los conteos.
+    tmp_output = output_path + ".tmp"
+    siguiente = 0
+    total = 0
+    ia_count = 0
+    preview = []
+    filas_backfill = {}
+
+    with open(journal_path, "a" if args.resume else "w", encoding="utf-8") as journal, \
+            open(tmp_output, "w", encoding="utf-8", newline="") as out:
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(OUTPUT_COLUMNS)
+
+        def escribir_listos():
+            # Los retomados del journal llegan a por_indice sin pasar por el loop
+            nonlocal siguiente, total, ia_count
+            while siguiente in por_indice:
+                res = por_indice.pop(siguiente)
+                siguiente += 1
+                if res is None:
+                    continue  # Sin cambios (--incremental)
+                if siguiente - 1 in backfill:
+                    filas_backfill[siguiente - 1] = total
+                writer.writerow([res.get(col, "") for col in OUTPUT_COLUMNS])
+                total += 1
+                ia_count += res["observacion"].startswith("🤖")
+                if len(preview) < 5:
+                    preview.append(res)
+
+        for i, fp, res, diferido in procesados:
+            entry = {"i": i, "fp": fp, "row": res}
+            if diferido:
+                entry["bf"] = True
+                backfill[i] = fp
+            if index is not None:
+                indexar.append((fp, claves_lead(res)))
+            with metrics.stage("write"):
+                journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                journal.flush()
+                por_indice[i] = res
+                escribir_listos()
+            print(f"[{i+1:02d}] {res['nombre']:<25} {res['telefono']:<15} {estado_lead(res, diferido)}")
+        escribir_listos()
+    if args.resume:
+        print(f"\n♻️  {retomados} leads retomados del journal, {total - retomados} procesados ahora.")
+
+    if cache is not None:
+        cache.close()
+
+    os.replace(tmp_output, output_path)
+    os.remove(journal_path)
+    backfill_path = output_path + BACKFILL_SUFFIX
+    write_backfill(backfill_path, {i: (fp, filas_backfill[i]) for i, fp in backfill.items()})
+    if index is not None:
+        registrar_incrementales(index, indexar, omitidos, os.path.basename(args.input_csv), metrics)
+
+    copy_ok = True
+    if args.copy_output or args.pg_dsn:
+        try:
+            # Se relee la salida ya escrita en vez de guardar todos los leads en memoria
+            with metrics.stage("copy", total), open(output_path, encoding="utf-8", newline="") as f:
+                export_copy(iter_copy_blocks(csv.DictReader(f), args.pg_batch_rows), args.copy_output,
+                            args.pg_dsn, args.pg_table, args.pg_batch_rows, metrics)
+        except Exception as e:
+            print(f"❌ Error en la salida COPY / carga a Postgres: {e}")
+            copy_ok = False
 
     print(f"\n{'='*60}")
     print(f"✅ Archivo generado: {output_path}")
-    print(f"   Total leads: {len(final_df)}")
-    ia_count  = sum(1 for r in results if r["observacion"].startswith("🤖"))
+    print(f"   Total leads: {total}")
     print(f"   Con perfil IA 🤖: {ia_count}")
     print(f"   Sin perfil (heurística): {total - ia_count}")
+    if backfill:
+        print(f"   ⏳ Plazo agotado: {len(backfill)} leads pendientes de --backfill ({backfill_path})")
+        metrics.incr("leads_backfill", len(backfill))
+    if coalescer is not None:
+        print(f"   Conversaciones repetidas: {coalescer.saved} llamadas LLM ahorradas")
+    if packer is not None and packer.requests:
+        print(f"   Empaquetado: {packer.packed} leads en {packer.requests} llamadas; "
+              f"{packer.retried} faltaron en la respuesta y se resumieron solos")
+    if guard is not None:
+        reportar_guard(guard, metrics)
+    if builder is not None and builder.leads:
+        ahorro = builder.saved_tokens / builder.leads
+        base = (builder.prompt_tokens + builder.saved_tokens) / builder.leads
+        print(f"   Prompt: ~{ahorro:.0f} tokens ahorrados por lead ({ahorro / base:.0%} de "
+              f"{base:.0f}), {len(builder.templates)} plantillas del bot")
+    if cache is not None:
+        print(f"   Cache de resúmenes: {cache.hits} hits / {cache.misses} misses")
+        metrics.incr("cache_hits", cache.hits)
+        metrics.incr("cache_misses", cache.misses)
+    for name, memo in memos.items():
+        hits, misses = memo_inicio[name]
+        metrics.observe_memo(memo.name, memo.hits - hits, memo.misses - misses)
+    metrics.incr("leads", total)
+    metrics.incr("leads_ia", ia_count)
+    metrics.print_summary()
+    report_path = args.report_json or os.path.splitext(output_path)[0] + "_report.json"
+    metrics.write_json(report_path)
+    print(f"   Reporte de la corrida: {report_path}")
+    if args.prom_textfile:
+        metrics.write_prometheus(args.prom_textfile)
     print(f"{'='*60}\n")
 
     # Mostrar preview de los primeros 5
     print("📋 PREVIEW (primeros 5 leads):")
     print("-" * 80)
-    preview = final_df.head(5)
-    for _, r in preview.iterrows():
+    for r in preview:
         obs_short = r['observacion'][:120].replace('\n', ' ')
         print(f"  Nombre:    {r['nombre']}")
         print(f"  Email:     {r['email'] or '(no encontrado)'}")
@@ -443,6 +1513,128 @@ def main():
         print(f"  Observ:    {obs_short}...")
         print()
 
+    return 0 if copy_ok else 1
+
+
+def reportar_guard(guard: LLMGuard, metrics: RunMetrics):
+    print(f"   Timeout de lectura Ollama al final: {guard.timeout.read_timeout():.0f}s")
+    saltados = metrics.counters.get("llm_breaker_skipped", 0)
+    if guard.breaker.opened:
+        print(f"   ⛔ Circuito abierto {guard.breaker.opened} veces; {saltados} leads fueron "
+              f"directo a heurística (estado final: {guard.breaker.state})")
+    metrics.incr("llm_breaker_opened", guard.breaker.opened)
+
+
+def estado_lead(res: dict, diferido: bool) -> str:
+    if diferido:
+        return "⏳ heurística (backfill)"
+    return "🤖 IA" if res["es_ia"] == "true" else "⚙️  heurística"
+
+
+def claves_lead(res: dict) -> list:
+    """Claves de identidad del lead normalizado (teléfono, email, RUT)."""
+    return identity_keys(res.get("telefono"), res.get("email"), res.get("rut"))
+
+def registrar_incrementales(index: LeadIndex, escritos: list, omitidos: int, source: str,
+                            metrics: RunMetrics):
+    """
+    Registra en el índice los leads ya escritos (huella, claves) y cuenta
+    cuántos son nuevos y cuántos cambiados: cambiado es un lead cuyo teléfono,
+    email o RUT ya estaba indexado con otra huella.
+    """
+    cambiados = sum(index.known(keys for _, keys in escritos))
+    index.record(escritos, source)
+    index.commit()
+    index.close()
+    print(f"\n🆕 Incremental: {len(escritos) - cambiados} nuevos, {cambiados} cambiados, "
+          f"{omitidos} sin cambios omitidos.")
+    metrics.incr("incremental_new", len(escritos) - cambiados)
+    metrics.incr("incremental_changed", cambiados)
+    metrics.incr("incremental_unchanged", omitidos)
+
+
+def run_backfill(args: argparse.Namespace, output_path: str, procesar: Callable,
+                 workers: int, metrics: RunMetrics) -> int:
+    """
+    Resume con IA los leads que una corrida con --deadline dejó con heurística
+    y reescribe solo esas filas de la salida (y, con --pg-dsn, solo sus
+    columnas observacion / es_ia en la base). Respeta --deadline: lo que no
+    alcance sigue marcado, igual que los leads que Ollama no pudo resumir.
+    """
+    backfill_path = output_path + BACKFILL_SUFFIX
+    marcados = load_backfill(backfill_path)
+    if not marcados:
+        print(f"✅ No hay leads pendientes de backfill para {output_path}")
+        return 0
+    if not os.path.exists(output_path):
+        print(f"❌ Falta la salida a actualizar: {output_path}")
+        return 1
+
+    items = []
+    for i, row in enumerate(metrics.timed_iter("read", iter_csv_envuelto(args.input_csv))):
+        if i in marcados:
+            fp = lead_fingerprint(row)
+            if fp == marcados[i][0]:
+                items.append((i, fp, row))
+    if len(items) < len(marcados):
+        print(f"⚠️  {len(marcados) - len(items)} leads cambiaron en la entrada; se quitan del backfill")
+    items.sort(key=lambda item: prioridad(item[2]))
+
+    actualizados, pendientes = {}, {}
+    for i, fp, res, diferido in map_en_orden(procesar, items, workers):
+        if diferido or res["es_ia"] != "true":
+            # Sin resumen IA (plazo, breaker abierto, timeout...): sigue marcado
+            pendientes[i] = marcados[i]
+        else:
+            actualizados[marcados[i][1]] = res
+        print(f"[{i+1:02d}] {res['nombre']:<25} {res['telefono']:<15} {estado_lead(res, diferido)}")
+
+    # Solo cambian las filas actualizadas; el resto se copia tal cual
+    tmp_output = output_path + ".tmp"
+    with metrics.stage("write", len(actualizados)), \
+            open(output_path, "r", encoding="utf-8", newline="") as src, \
+            open(tmp_output, "w", encoding="utf-8", newline="") as out:
+        reader = csv.reader(src)
+        writer = csv.writer(out, lineterminator="\n")
+        header = next(reader)
+        writer.writerow(header)
+        for j, fila in enumerate(reader):
+            if len(fila) != len(header):
+                print(f"❌ La fila {j + 1} de {output_path} no tiene {len(header)} columnas; no se modifica")
+                out.close()
+                os.remove(tmp_output)
+                return 1
+            res = actualizados.get(j)
+            writer.writerow([res.get(col, "") for col in header] if res else fila)
+    os.replace(tmp_output, output_path)
+    write_backfill(backfill_path, pendientes)
+
+    code = 0
+    if args.pg_dsn and actualizados:
+        try:
+            with metrics.stage("copy", len(actualizados)):
+                updated = update_copy_blocks(iter_copy_blocks(actualizados.values(), args.pg_batch_rows),
+                                             args.pg_dsn, args.pg_table, metrics=metrics)
+            print(f"🐘 Postgres ({args.pg_table}): {updated} leads actualizados")
+        except Exception as e:
+            print(f"❌ Error al actualizar Postgres: {e}")
+            code = 1
+
+    print(f"\n✅ Backfill: {len(actualizados)} leads actualizados en {output_path}")
+    if pendientes:
+        print(f"   ⏳ Siguen pendientes: {len(pendientes)} ({backfill_path})")
+    metrics.incr("leads_backfilled", len(actualizados))
+    metrics.incr("leads_backfill", len(pendientes))
+    metrics.print_summary()
+    metrics.write_json(args.report_json or os.path.splitext(output_path)[0] + "_report.json")
+    if args.prom_textfile:
+        metrics.write_prometheus(args.prom_textfile)
+    return code
+
+
+def main():
+    sys.exit(run(build_parser().parse_args()))
+
 
 if __name__ == "__main__":
     main()
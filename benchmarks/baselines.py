@@ -0,0 +1,121 @@
+"""
+baselines.py - Implementaciones anteriores, como referencia para --compare
+==========================================================================
+Copias de código que los normalizadores ya reemplazaron, para medir el antes
+y el después sobre el mismo archivo (ver run_bench.py --compare). No las usa
+ningún normalizador.
+"""
+
+import ast
+import json
+import re
+
+import ai_normalizer
+import normalizer
+
+
+def recover_missing_emails_iterrows(df, text_cols):
+    """Recuperación de emails fila a fila con iterrows + df.at (antes de recover_missing_emails)."""
+    for idx, row in df.iterrows():
+        if not row['email']:  # If email is missing
+            for col in text_cols:
+                extracted = normalizer.extract_email_from_text(row[col])
+                if extracted:
+                    df.at[idx, 'email'] = extracted
+                    break
+    return df
+
+
+# ai_normalizer antes de extract_fields: cada extract_* recorre la conversación
+# por su cuenta (extract_email la baja entera a minúsculas, extract_renta
+# rearma el texto del CLIENTE) y --no-llm la vuelve a dividir en líneas
+RUT_RE   = re.compile(r"\b(\d{1,2}\.?\d{3}\.?\d{3}|\d{7,8})-?([\dkK])\b")
+PHONE_RE = re.compile(r"\b(56\d{9}|\d{8,9})\b")
+
+
+def only_client(conv):
+    parts = [ln.replace("CLIENTE:", "").strip()
+             for ln in conv.splitlines() if ln.startswith("CLIENTE:")]
+    return " ".join(parts)
+
+
+def extract_email(conv):
+    m = ai_normalizer.EMAIL_RE.search(conv.lower())
+    return m.group(0) if m else ""
+
+
+def extract_phone(raw_phone, conv):
+    digits = re.sub(r'\D', '', raw_phone or "")
+    if len(digits) == 11 and digits.startswith("56"):
+        return f"+{digits}"
+    if len(digits) == 9 and digits.startswith("9"):
+        return f"+56{digits}"
+    if len(digits) == 8:
+        return f"+569{digits}"
+    if not digits:
+        m = PHONE_RE.search(conv)
+        if m:
+            d2 = m.group(0)
+            if d2.startswith("56") and len(d2) == 11:
+                return f"+{d2}"
+    return f"+{digits}" if digits else ""
+
+
+def extract_renta(conv):
+    client = only_client(conv)
+    if not ai_normalizer.INCOME_CTX_RE.search(client):
+        return "0"
+    m = ai_normalizer.MONEY_MILL_RE.search(client)
+    if m:
+        try:
+            return str(int(float(m.group(1).replace(",", ".")) * 1_000_000))
+        except Exception:
+            pass
+    m = ai_normalizer.MONEY_MIL_RE.search(client)
+    if m:
+        try:
+            return str(int(m.group(1)) * 1000)
+        except Exception:
+            pass
+    m = ai_normalizer.MONEY_NUM_RE.search(client)
+    if m:
+        clean = re.sub(r'[^\d]', '', m.group(1))
+        if clean:
+            return clean
+    return "0"
+
+
+def extract_rut(conv):
+    m = RUT_RE.search(conv)
+    return m.group(0) if m else ""
+
+
+def extract_fields_por_separado(raw_phone, conv):
+    """Lo mismo que ai_normalizer.extract_fields, con las llamadas sueltas de antes."""
+    return {
+        "email":    extract_email(conv),
+        "telefono": extract_phone(raw_phone, conv),
+        "rut":      extract_rut(conv),
+        "renta":    extract_renta(conv),
+        "lineas_cliente": [ln.replace("CLIENTE:", "").strip()
+                           for ln in conv.splitlines() if ln.startswith("CLIENTE:")],
+    }
+
+
+def decode_cascada(raw):
+    """
+    Decodificación de parse_chat antes de transcript.decode_transcript: des-duplica
+    comillas, prueba json.loads y después ast.literal_eval. Devuelve la lista de
+    mensajes, o None cuando parse_chat caía al texto sin corchetes.
+    """
+    raw = raw.strip()
+    if '""' in raw and ('sender' in raw or 'message' in raw):
+        raw = raw.replace('""', '"')
+    try:
+        data = json.loads(raw)
+    except Exception:
+        try:
+            data = ast.literal_eval(raw)
+        except Exception:
+            return None
+    return data if isinstance(data, list) else None
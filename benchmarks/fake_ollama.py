@@ -0,0 +1,99 @@
+"""
+fake_ollama.py - Servidor local que imita /api/generate de Ollama
+=================================================================
+Para medir ai_normalizer sin GPU ni modelo: responde con un resumen fijo tras
+una latencia configurable, falla con la tasa indicada (HTTP 500) y entrega los
+mismos campos de métricas que Ollama (prompt_eval_count, eval_count,
+eval_duration en ns). Atiende en paralelo, como OLLAMA_NUM_PARALLEL > 1.
+
+Uso:
+    python -m benchmarks.fake_ollama --port 11434 --latency 0.8 --jitter 0.3 --fail-rate 0.02
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RESPONSE_TEXT = ("Resumen: cliente interesado en el proyecto, consulta por precios.\n"
+                 "Datos Clave: renta informada en la conversación.\n"
+                 "Siguiente Paso: llamar para agendar visita.")
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    jitter = 0.0
+    fail_rate = 0.0
+    eval_tokens = 60
+    requests_served = 0
+    _lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._send(200, {"status": "Ollama is running"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        cls = type(self)
+        with cls._lock:
+            cls.requests_served += 1
+
+        delay = max(0.0, random.gauss(cls.latency, cls.jitter)) if cls.jitter else cls.latency
+        time.sleep(delay)
+        if random.random() < cls.fail_rate:
+            self._send(500, {"error": "fake failure"})
+            return
+
+        prompt = payload.get("prompt", "")
+        num_predict = (payload.get("options") or {}).get("num_predict", cls.eval_tokens)
+        eval_count = min(cls.eval_tokens, num_predict)
+        self._send(200, {
+            "model": payload.get("model"),
+            "response": RESPONSE_TEXT,
+            "done": True,
+            "prompt_eval_count": len(prompt) // 4,
+            "prompt_eval_duration": int(delay * 0.2 * 1e9),
+            "eval_count": eval_count,
+            "eval_duration": int(delay * 0.8 * 1e9),
+            "total_duration": int(delay * 1e9),
+        })
+
+
+def start_fake_ollama(port=0, latency=0.0, jitter=0.0, fail_rate=0.0):
+    """Levanta el servidor en un hilo de fondo; retorna (server, url_generate)."""
+    handler = type("Handler", (FakeOllamaHandler,), {
+        "latency": latency, "jitter": jitter, "fail_rate": fail_rate, "requests_served": 0,
+        "_lock": threading.Lock(),
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/api/generate"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor falso de Ollama para benchmarks")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.5, help="Segundos por respuesta (media)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Desviación estándar de la latencia")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fracción de respuestas HTTP 500")
+    args = parser.parse_args()
+    server, url = start_fake_ollama(args.port, args.latency, args.jitter, args.fail_rate)
+    print(f"🧪 Ollama falso escuchando en {url} (Ctrl+C para salir)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
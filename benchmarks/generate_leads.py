@@ -0,0 +1,194 @@
+"""
+generate_leads.py - Generadores de exports sintéticos para benchmarks
+=====================================================================
+Produce archivos con la forma de los exports reales, a cualquier escala:
+
+  portal-csv   CSV de portal con cabeceras mezcladas (sinónimos de COLUMN_MAPPING,
+               columnas de ruido, teléfonos/rentas/emails en formatos variados)
+  portal-xlsx  lo mismo en .xlsx (Excel admite como máximo 1.048.575 filas)
+  swallowed    CSV con cada fila envuelta en comillas ("swallowed" rows)
+  chat         CSV envuelto con transcripción JSON, el formato de read_csv_envuelto;
+               con --corrupt-rate, esa fracción de transcripciones sale rota
+               (JSON truncado, literal de Python, comillas duplicadas o basura)
+
+Uso:
+    python -m benchmarks.generate_leads chat 100000 /tmp/chat_100k.csv
+    python -m benchmarks.generate_leads chat 10000 /tmp/chat_rotos.csv --corrupt-rate 0.5
+    python -m benchmarks.generate_leads portal-csv 1000000 /tmp/portal_1m.csv --seed 7
+    python -m benchmarks.generate_leads portal-xlsx 100000 /tmp/ancho.xlsx --extra-columns 30
+"""
+
+import argparse
+import csv
+import json
+import random
+
+NOMBRES   = ["Juan", "María", "José", "Camila", "Pedro", "Valentina", "Diego", "Fernanda",
+             "Tomás", "Antonia", "Matías", "Catalina", "Benjamín", "Javiera", "Ignacio"]
+APELLIDOS = ["González", "Muñoz", "Rojas", "Díaz", "Pérez", "Soto", "Contreras", "Silva",
+             "Martínez", "Sepúlveda", "Morales", "Rodríguez", "López", "Fuentes"]
+PROYECTOS = ["Parque Ñuñoa", "Vista Maipú", "Mirador La Florida", "Costanera Sur",
+             "Alto Macul", "Plaza Independencia"]
+DOMINIOS  = ["gmail.com", "hotmail.com", "yahoo.es", "outlook.cl", "urbani.cl"]
+RENTAS    = ["1.200.000_a_1.500.000", "$1.000.000 - $1.500.000", "800.000", "1500000",
+             "Más de 2.000.000", "menos de 700 mil", "", "N/A"]
+ESTADOS   = ["🔥 Caliente", "Tibio", "Frío", "caliente", "", "Sin respuesta"]
+
+# Variantes de cabecera por columna destino; la primera columna de ruido
+# se intercala para que el mapeo no dependa del orden.
+HEADER_VARIANTS = {
+    "nombre":      ["Nombre", "Nombre Cliente", "Prospecto", "Full Name", "nombres"],
+    "email":       ["Email", "Correo", "Correo Electronico", "E-mail", "mail"],
+    "telefono":    ["Telefono", "Celular", "Fono", "Mobile", "Phone"],
+    "renta":       ["Renta", "Renta Liquida", "Sueldo", "Ingreso", "Income"],
+    "proyecto":    ["Proyecto", "Obra", "Condominio", "Project"],
+    "observacion": ["Observacion", "Comentario", "Nota", "Detalle"],
+}
+NOISE_COLUMNS = ["Fecha", "ID Lead", "Origen", "Campaña", "UTM Source"]
+
+BOT_MESSAGES = [
+    "¡Hola! Soy el asistente virtual de Urbani 🏡 ¿En qué proyecto estás interesado?",
+    "Gracias por tu interés. ¿Cuál es tu renta líquida mensual aproximada?",
+    "Perfecto, un ejecutivo se pondrá en contacto contigo a la brevedad.",
+    "¿Nos podrías indicar tu correo electrónico?",
+]
+CLIENT_MESSAGES = [
+    "Hola", "quiero info", "me interesa comprar para vivir", "para invertir",
+    "mi renta es {renta} líquido", "gano {mil} mil", "mi sueldo es {mill} millones",
+    "mi correo es {email}", "mi rut es {rut}", "llámenme mañana en la tarde",
+    "cuánto es el pie?", "tienen de 2 dormitorios?",
+]
+
+
+def _phone(rng):
+    n = rng.randint(10_000_000, 99_999_999)
+    return rng.choice([f"9{n}", f"+569{n}", f"569 {n}", f"{n}", f"(9) {n // 10_000} {n % 10_000}", ""])
+
+def _email(rng, nombre, apellido):
+    user = f"{nombre}.{apellido}{rng.randint(1, 999)}".lower()
+    return rng.choice([f"{user}@{rng.choice(DOMINIOS)}", f" {user.upper()}@{rng.choice(DOMINIOS)} ",
+                       "", "sin correo", f"\\n{user}@{rng.choice(DOMINIOS)}"])
+
+def _rut(rng):
+    n = rng.randint(5_000_000, 25_999_999)
+    return rng.choice([f"{n:,}".replace(",", ".") + f"-{rng.choice('0123456789K')}", f"{n}-{rng.randint(0, 9)}"])
+
+def _conversation(rng, email):
+    msgs = [{"sender": "bot", "message": BOT_MESSAGES[0]}]
+    for _ in range(rng.choice([0, 1, 1, 2, 3, 5, 8])):
+        texto = rng.choice(CLIENT_MESSAGES).format(
+            renta=rng.choice(["1.200.000", "900000", "1,5 millones"]), mil=rng.choice([600, 800, 950]),
+            mill=rng.choice(["1", "1,5", "2"]), email=email or "cliente@gmail.com", rut=_rut(rng))
+        msgs.append({"sender": "user", "message": texto})
+        msgs.append({"sender": "bot", "message": rng.choice(BOT_MESSAGES[1:])})
+    return msgs
+
+
+def _corrupt(rng, conv):
+    """Una transcripción rota como las que llegan de los exports reales."""
+    text = json.dumps(conv, ensure_ascii=False)
+    kind = rng.choice(["truncado", "python", "comillas", "basura"])
+    if kind == "truncado":
+        return text[:rng.randint(len(text) // 3, len(text) - 2)]
+    if kind == "python":
+        return repr(conv)
+    if kind == "comillas":
+        return text.replace('"', '""')
+    # Empieza con [{ para que parse_linea_envuelta igual encuentre la transcripción
+    return "[{ " + " ".join(m["message"] for m in conv) + " ]"
+
+def portal_rows(rows, rng, extra_columns=0):
+    """
+    Cabecera + filas de un export de portal con cabeceras elegidas al azar.
+    extra_columns agrega columnas de relleno que el normalizador no usa,
+    como las de los exports anchos del CRM.
+    """
+    targets = list(HEADER_VARIANTS)
+    header = [rng.choice(HEADER_VARIANTS[t]) for t in targets]
+    noise = rng.sample(NOISE_COLUMNS, 2)
+    header = [noise[0]] + header + [noise[1], "Transcripcion"] + [f"Campo {k}" for k in range(extra_columns)]
+    yield header
+    for i in range(rows):
+        nombre, apellido = rng.choice(NOMBRES), rng.choice(APELLIDOS)
+        email = _email(rng, nombre, apellido)
+        conv = _conversation(rng, email.strip() if "@" in email else "")
+        yield [
+            f"2024-0{rng.randint(1, 9)}-{rng.randint(10, 28)}",
+            f"{nombre} {apellido}", email, _phone(rng), rng.choice(RENTAS), rng.choice(PROYECTOS),
+            rng.choice(["", "llamar en la tarde", f"pidió cotización, {email}", "no contesta"]),
+            rng.choice(["web", "portal", "facebook"]), json.dumps(conv, ensure_ascii=False),
+        ] + [rng.choice(["si", "no", "", i * k, "texto libre de relleno"]) for k in range(extra_columns)]
+
+def write_portal_csv(path, rows, rng, extra_columns=0):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        csv.writer(f).writerows(portal_rows(rows, rng, extra_columns))
+
+def write_portal_xlsx(path, rows, rng, extra_columns=0):
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    for row in portal_rows(rows, rng, extra_columns):
+        ws.append(row)
+    wb.save(path)
+
+def write_swallowed_csv(path, rows, rng, extra_columns=0):
+    """Cada fila de datos queda dentro de un solo campo entre comillas."""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        it = portal_rows(rows, rng)
+        header = next(it)[1:7]
+        f.write(",".join(header) + "\n")
+        for row in it:
+            fields = [str(v).replace(",", " ").replace('"', "") for v in row[1:7]]
+            f.write('"' + ",".join(fields) + '"\n')
+
+def write_chat_csv(path, rows, rng, extra_columns=0, corrupt_rate=0.0):
+    """
+    CSV envuelto: toda la fila entre comillas y las comillas del JSON duplicadas.
+    Una fracción corrupt_rate de las transcripciones sale rota (ver _corrupt).
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("fecha_creacion,nombre_usuario,telefono,transcripcion,project_tag,tag_estado,"
+                "cantidad_mensajes,outcome\n")
+        for i in range(rows):
+            nombre, apellido = rng.choice(NOMBRES), rng.choice(APELLIDOS)
+            email = f"{nombre}.{apellido}{i}@{rng.choice(DOMINIOS)}".lower() if rng.random() < 0.3 else ""
+            conv = _conversation(rng, email)
+            nombre_usuario = rng.choice([f"{nombre} {apellido}", f"{nombre} 😀", "🏠", nombre.lower()])
+            row = ",".join([
+                f"2024-0{rng.randint(1, 9)}-{rng.randint(10, 28)}", nombre_usuario, _phone(rng),
+                _corrupt(rng, conv) if rng.random() < corrupt_rate else json.dumps(conv, ensure_ascii=False),
+                rng.choice(PROYECTOS), rng.choice(ESTADOS),
+                str(len(conv)), rng.choice(["agendado", "abandonado", "derivado"]),
+            ])
+            f.write('"' + row.replace('"', '""') + '"\n')
+
+
+GENERATORS = {
+    "portal-csv":  write_portal_csv,
+    "portal-xlsx": write_portal_xlsx,
+    "swallowed":   write_swallowed_csv,
+    "chat":        write_chat_csv,
+}
+
+def generate(kind, rows, path, seed=0, extra_columns=0, corrupt_rate=0.0):
+    # Solo las transcripciones de chat pueden salir rotas
+    kwargs = {"corrupt_rate": corrupt_rate} if corrupt_rate else {}
+    GENERATORS[kind](path, rows, random.Random(seed), extra_columns, **kwargs)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera exports sintéticos de leads")
+    parser.add_argument("kind", choices=sorted(GENERATORS))
+    parser.add_argument("rows", type=int)
+    parser.add_argument("path")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--extra-columns", type=int, default=0,
+                        help="Columnas de relleno extra (portal-csv / portal-xlsx)")
+    parser.add_argument("--corrupt-rate", type=float, default=0.0,
+                        help="Fracción de transcripciones rotas (solo chat)")
+    args = parser.parse_args()
+    if args.corrupt_rate and args.kind != "chat":
+        parser.error("--corrupt-rate solo aplica a chat")
+    generate(args.kind, args.rows, args.path, args.seed, args.extra_columns, args.corrupt_rate)
+    print(f"✅ {args.rows} filas ({args.kind}) -> {args.path}")
@@ -0,0 +1,332 @@
+"""
+run_bench.py - Benchmark por etapas de normalizer.py y ai_normalizer.py
+=======================================================================
+Genera (o usa) un archivo sintético y mide cada etapa por separado, con su
+throughput en filas/s y el pico de memoria (RSS) alcanzado durante la etapa.
+
+  normalizer     (portal-csv, portal-xlsx, swallowed): read, map, clean, write
+  ai_normalizer  (chat): read, parse, extract, summarize, write
+
+La etapa summarize usa un Ollama falso local (benchmarks/fake_ollama.py) con
+latencia y tasa de fallas configurables, sobre las primeras --llm-rows filas.
+
+Con --compare se mide además la implementación anterior de algunas etapas
+(benchmarks/baselines.py) sobre los mismos datos, se verifica que den lo
+mismo y se informa la aceleración:
+
+  normalizer     emails-old (iterrows) vs emails (recover_missing_emails)
+  ai_normalizer  extract-old (extract_* sueltos) vs extract (extract_fields)
+                 decode-old (json -> ast.literal_eval) vs decode (decode_transcript),
+                 por separado sobre transcripciones válidas y rotas
+
+En decode las rotas no dan lo mismo a propósito (la cascada anterior las
+perdía): se informa cuántas recupera cada una. --corrupt-rate controla la
+fracción de transcripciones rotas que genera generate_leads.py.
+
+Uso:
+    python -m benchmarks.run_bench portal-csv --rows 100000
+    python -m benchmarks.run_bench chat --rows 1000 --llm-latency 0.3 --workers 4
+    python -m benchmarks.run_bench portal-csv --rows 1000 --check   # + paridad de limpiadores
+    python -m benchmarks.run_bench portal-csv --rows 200000 --compare
+    python -m benchmarks.run_bench chat --rows 100000 --compare
+    python -m benchmarks.run_bench chat --rows 100000 --compare --corrupt-rate 0.3
+    python -m benchmarks.run_bench portal-xlsx --rows 100000 --extra-columns 30
+    python -m benchmarks.run_bench chat --input export_real.csv --json reporte.json
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import requests
+
+import ai_normalizer
+import normalizer
+import transcript
+from benchmarks import baselines
+from benchmarks.fake_ollama import start_fake_ollama
+from benchmarks.generate_leads import generate
+
+EXTENSIONS = {"portal-csv": ".csv", "portal-xlsx": ".xlsx", "swallowed": ".csv", "chat": ".csv"}
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        # Sin /proc (macOS/Windows): máximo histórico del proceso
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+class PeakRSS:
+    """Muestrea el RSS en un hilo de fondo para obtener el pico de una etapa."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss_mb()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_mb())
+
+
+class StageReport:
+    def __init__(self):
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, rows):
+        with PeakRSS() as mem:
+            start = time.perf_counter()
+            yield
+            seconds = time.perf_counter() - start
+        self.stages.append({"stage": name, "rows": rows, "seconds": round(seconds, 4),
+                            "rows_per_s": round(rows / seconds, 1) if seconds else None,
+                            "peak_rss_mb": round(mem.peak, 1)})
+
+    def seconds(self, name):
+        return next(s["seconds"] for s in self.stages if s["stage"] == name)
+
+    def print_speedup(self, before, after, same):
+        """same=None: los resultados no se comparan (difieren a propósito)."""
+        antes, despues = self.seconds(before), self.seconds(after)
+        veces = antes / despues if despues else float("inf")
+        linea = f"   {before} {antes:.3f}s -> {after} {despues:.3f}s: {veces:.1f}x"
+        if same is not None:
+            linea += f", {'mismo resultado' if same else 'RESULTADO DISTINTO'}"
+        print(linea)
+        if same is False:
+            sys.exit(1)
+
+    def print(self, title):
+        print(f"\n{title}")
+        print(f"{'etapa':<18} {'filas':>9} {'seg':>9} {'filas/s':>12} {'pico RSS MB':>12}")
+        for s in self.stages:
+            print(f"{s['stage']:<18} {s['rows']:>9} {s['seconds']:>9.3f} "
+                  f"{s['rows_per_s'] or 0:>12.1f} {s['peak_rss_mb']:>12.1f}")
+
+
+def bench_normalizer(path, report, check=False, compare=False):
+    with report.stage("read", 0):
+        df = normalizer.read_input(path)
+    rows = len(df)
+    report.stages[-1].update(rows=rows, rows_per_s=round(rows / report.stages[-1]["seconds"], 1))
+
+    with report.stage("map", rows):
+        renamed_cols = normalizer.map_columns(df.columns)
+
+    if check:
+        check_cleaner_parity(df, renamed_cols)
+    if compare:
+        compare_email_recovery(df, renamed_cols, report)
+
+    with report.stage("clean", rows):
+        final_df = normalizer.clean_frame(df, renamed_cols, verbose=False)
+
+    with tempfile.NamedTemporaryFile(suffix=".csv", delete=False) as tmp:
+        out = tmp.name
+    with report.stage("write", rows):
+        final_df.to_csv(out, index=False, encoding="utf-8")
+    os.remove(out)
+
+
+def check_cleaner_parity(df, renamed_cols):
+    """Compara los limpiadores por columna con Series.apply del limpiador por celda."""
+    pairs = {"telefono": (normalizer.clean_phone, normalizer.clean_phone_column),
+             "renta": (normalizer.clean_rent, normalizer.clean_rent_column),
+             "email": (normalizer.clean_email, normalizer.clean_email_column)}
+    lowered = {c.strip().lower(): c for c in df.columns}
+    for original, target in renamed_cols.items():
+        if target not in pairs:
+            continue
+        series = df[lowered[original]]
+        per_cell, column_wide = pairs[target]
+        expected, got = series.apply(per_cell), column_wide(series)
+        status = "OK" if expected.tolist() == got.tolist() else "DIFERENCIA"
+        print(f"   paridad {target:<9} {status}")
+        if status != "OK":
+            sys.exit(1)
+
+
+def compare_email_recovery(df, renamed_cols, report):
+    """Recuperación de emails desde columnas de texto: iterrows anterior vs por columna."""
+    frame = df.copy()
+    frame.columns = [c.strip().lower() for c in frame.columns]
+    frame = frame.rename(columns=renamed_cols)
+    frame["email"] = normalizer.clean_email_column(frame["email"]) if "email" in frame else ""
+    text_cols = [c for c in frame.columns if any(x in c for x in normalizer.EMAIL_SCAN_COLUMNS)]
+    rows = len(frame)
+    print(f"   emails: {int((frame['email'] == '').sum())} de {rows} filas sin email, "
+          f"columnas de texto {text_cols}")
+
+    old, new = frame.copy(), frame.copy()
+    with report.stage("emails-old", rows):
+        baselines.recover_missing_emails_iterrows(old, text_cols)
+    with report.stage("emails", rows):
+        normalizer.recover_missing_emails(new, text_cols)
+    report.print_speedup("emails-old", "emails", old["email"].tolist() == new["email"].tolist())
+
+
+def _decode(raw):
+    try:
+        data = transcript.decode_transcript(raw)
+    except ValueError:
+        return None
+    return data if isinstance(data, list) else None
+
+
+def compare_decode(raws, report):
+    """decode-old vs decode, por separado sobre transcripciones válidas y rotas."""
+    validas, rotas = [], []
+    for raw in raws:
+        try:
+            json.loads(raw)
+            validas.append(raw)
+        except ValueError:
+            rotas.append(raw)
+    for nombre, grupo in (("validas", validas), ("rotas", rotas)):
+        if not grupo:
+            continue
+        with report.stage(f"decode-old:{nombre}", len(grupo)):
+            old = [baselines.decode_cascada(raw) for raw in grupo]
+        with report.stage(f"decode:{nombre}", len(grupo)):
+            new = [_decode(raw) for raw in grupo]
+        if nombre == "validas":
+            report.print_speedup(f"decode-old:{nombre}", f"decode:{nombre}", old == new)
+        else:
+            report.print_speedup(f"decode-old:{nombre}", f"decode:{nombre}", None)
+            print(f"   rotas: decode-old recupera {sum(d is not None for d in old)}/{len(grupo)}, "
+                  f"decode {sum(d is not None for d in new)}/{len(grupo)}")
+
+
+def bench_ai_normalizer(path, report, llm_rows, latency, fail_rate, workers, compare=False):
+    with report.stage("read", 0):
+        records = list(ai_normalizer.iter_csv_envuelto(path))
+    rows = len(records)
+    report.stages[-1].update(rows=rows, rows_per_s=round(rows / report.stages[-1]["seconds"], 1))
+
+    raws = [str(r.get("transcripcion", "")).strip() for r in records]
+    if compare:
+        compare_decode(raws, report)
+
+    with report.stage("parse", rows):
+        convs = [ai_normalizer.parse_chat(raw) for raw in raws]
+
+    # Como process_lead: los campos salen del inicio de la conversación
+    phones = [str(r.get("telefono_raw", "")).strip() for r in records]
+    cortes = [conv[:ai_normalizer.MAX_CONV_CHARS] for conv in convs]
+    if compare:
+        with report.stage("extract-old", rows):
+            old = [baselines.extract_fields_por_separado(phone, conv) for phone, conv in zip(phones, cortes)]
+
+    with report.stage("extract", rows):
+        fields = [ai_normalizer.extract_fields(phone, conv) for phone, conv in zip(phones, cortes)]
+        names = [ai_normalizer.clean_name(str(r.get("nombre_usuario", "")).strip()) for r in records]
+    if compare:
+        report.print_speedup("extract-old", "extract", old == fields)
+        print(f"   extract: {report.seconds('extract-old') / rows * 1e6:.1f} -> "
+              f"{report.seconds('extract') / rows * 1e6:.1f} us por lead")
+
+    server, url = start_fake_ollama(latency=latency, fail_rate=fail_rate)
+    ai_normalizer.OLLAMA_URL = url
+    session = requests.Session()
+    if workers > 1:
+        session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=workers))
+    n = min(llm_rows, rows)
+
+    def summarize(i):
+        return ai_normalizer.ollama_summary(session, names[i], fields[i]["telefono"],
+                                            records[i].get("tag_estado", ""), convs[i])
+
+    with report.stage("summarize", n):
+        summaries = list(ai_normalizer.map_en_orden(summarize, range(n), workers))
+    server.shutdown()
+    ia = sum(1 for _, por_ia in summaries if por_ia)
+    print(f"   summarize: {ia}/{n} por IA (Ollama falso, latencia {latency}s, fallas {fail_rate:.0%})")
+
+    results = [{"nombre": names[i], "email": f["email"], "telefono": f["telefono"], "rut": f["rut"],
+                "renta": f["renta"], "observacion": summaries[i][0] if i < n else ""}
+               for i, f in enumerate(fields)]
+    with tempfile.NamedTemporaryFile(suffix=".csv", delete=False) as tmp:
+        out = tmp.name
+    with report.stage("write", rows):
+        pd.DataFrame(results).to_csv(out, index=False, encoding="utf-8")
+    os.remove(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark por etapas de los normalizadores")
+    parser.add_argument("kind", choices=sorted(EXTENSIONS))
+    parser.add_argument("--rows", type=int, default=1000, help="Filas a generar (1000, 100000, 1000000...)")
+    parser.add_argument("--input", help="Usar este archivo en vez de generar uno")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--extra-columns", type=int, default=0,
+                        help="Columnas de relleno que el normalizador no usa (exports anchos)")
+    parser.add_argument("--corrupt-rate", type=float, default=0.0,
+                        help="Fracción de transcripciones rotas a generar (solo chat)")
+    parser.add_argument("--check", action="store_true", help="Verificar paridad de los limpiadores por columna")
+    parser.add_argument("--compare", action="store_true",
+                        help="Medir también la implementación anterior de las etapas (baselines.py)")
+    parser.add_argument("--llm-rows", type=int, default=200, help="Filas a resumir con el Ollama falso")
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--llm-fail-rate", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--json", help="Guardar el reporte en este archivo JSON")
+    args = parser.parse_args()
+    if args.corrupt_rate and args.kind != "chat":
+        parser.error("--corrupt-rate solo aplica a chat")
+
+    path = args.input
+    generated = False
+    if not path:
+        fd, path = tempfile.mkstemp(suffix=EXTENSIONS[args.kind])
+        os.close(fd)
+        t0 = time.perf_counter()
+        generate(args.kind, args.rows, path, args.seed, args.extra_columns, args.corrupt_rate)
+        generated = True
+        print(f"🧪 Generadas {args.rows} filas {args.kind} en {time.perf_counter() - t0:.1f}s "
+              f"({os.path.getsize(path) / 2**20:.1f} MB)")
+
+    report = StageReport()
+    try:
+        if args.kind == "chat":
+            bench_ai_normalizer(path, report, args.llm_rows, args.llm_latency,
+                                args.llm_fail_rate, args.workers, compare=args.compare)
+        else:
+            bench_normalizer(path, report, check=args.check, compare=args.compare)
+    finally:
+        if generated:
+            os.remove(path)
+
+    report.print(f"📊 {args.kind} ({os.path.basename(args.input) if args.input else f'{args.rows} filas'})")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"kind": args.kind, "rows": args.rows, "stages": report.stages}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
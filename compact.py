@@ -0,0 +1,104 @@
+"""
+compact.py - Dtypes compactos para los frames de leads
+======================================================
+Al leer, cada columna de texto queda como object (o como el string por
+defecto de pandas). compact_frame asigna dtypes explícitos:
+
+  - category para las columnas de pocos valores distintos (proyecto,
+    project_tag, tag_estado, outcome...): cada valor se guarda una vez y las
+    filas guardan solo un código
+  - strings respaldados por Arrow para el resto del texto, si hay pyarrow
+  - enteros para renta, solo si el texto vuelve idéntico al convertirlo
+
+Los nulos siguen siendo NaN y to_csv escribe los mismos valores: el CSV de
+salida no cambia.
+"""
+
+import pandas as pd
+
+# Una columna de texto pasa a category si sus valores distintos son a lo sumo
+# esta fracción de las filas
+CATEGORY_MAX_RATIO = 0.05
+
+
+def _arrow_string_dtype():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return None
+    # Variante con NaN como nulo (no pd.NA): str(valor) y las comparaciones
+    # siguen dando lo mismo que con object
+    try:
+        return pd.StringDtype("pyarrow", na_value=float("nan"))  # pandas >= 2.3
+    except TypeError:
+        pass
+    try:
+        return pd.StringDtype("pyarrow_numpy")  # pandas 2.1 / 2.2
+    except (TypeError, ValueError):
+        return None
+
+
+ARROW_STRING_DTYPE = _arrow_string_dtype()
+
+
+def frame_memory(df: pd.DataFrame) -> int:
+    """Bytes que ocupa el frame, contando el contenido de los strings."""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def _is_text(series: pd.Series) -> bool:
+    return series.dtype == object or isinstance(series.dtype, pd.StringDtype)
+
+
+def to_integer(series: pd.Series):
+    """
+    La columna como entero nullable (Int32 si alcanza, si no Int64). Retorna
+    None si algún valor no vuelve idéntico como texto (ceros a la izquierda,
+    decimales, números más allá de int64...).
+    """
+    text = series.astype(object)
+    present = series.notna() & (text != "")
+    numbers = pd.to_numeric(text.where(present), errors="coerce")
+    if numbers[present].isna().any():
+        return None
+    try:
+        ints = numbers.astype("Int64")
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if not (ints[present].astype(str) == text[present].astype(str)).all():
+        return None
+    if ints.notna().any() and -2**31 <= ints.min() and ints.max() < 2**31:
+        return ints.astype("Int32")
+    return ints
+
+
+def compact_frame(df: pd.DataFrame, categories=(), integers=(), keep=()) -> pd.DataFrame:
+    """
+    Copia de df con dtypes compactos. categories fuerza category, integers
+    intenta enteros y keep deja columnas intactas (las que se modifican más
+    adelante). El resto del texto pasa a category si tiene pocos valores
+    distintos, o a strings Arrow.
+    """
+    out = df.copy(deep=False)
+    rows = len(df)
+    for col in df.columns:
+        if col in keep:
+            continue
+        series = df[col]
+        if col in integers:
+            ints = to_integer(series)
+            if ints is not None:
+                out[col] = ints
+                continue
+        if not _is_text(series):
+            continue
+        if col in categories or (rows and series.nunique() <= rows * CATEGORY_MAX_RATIO):
+            out[col] = series.astype("category")
+        elif ARROW_STRING_DTYPE is not None and series.dtype != ARROW_STRING_DTYPE:
+            out[col] = series.astype(ARROW_STRING_DTYPE)
+    return out
+
+
+def reduction(before: int, after: int) -> float:
+    """Reducción porcentual de memoria."""
+    return (1 - after / before) * 100 if before else 0.0
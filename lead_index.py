@@ -0,0 +1,123 @@
+"""
+lead_index.py - Índice persistente de leads ya normalizados (--incremental)
+===========================================================================
+Cada export suele ser el de ayer más unos cientos de filas nuevas. El índice
+guarda, en SQLite, la huella de cada fila de entrada ya procesada y las
+claves de identidad del lead (teléfono normalizado, email, RUT), así una
+corrida --incremental procesa y escribe solo las filas nuevas o cambiadas:
+
+  - huella ya vista                     -> fila sin cambios, se omite
+  - huella nueva, identidad ya vista    -> lead cambiado
+  - huella nueva, identidad desconocida -> lead nuevo
+
+Cada normalizador usa su propio scope (sus huellas no son comparables). La
+huella la calcula quien llama (bytes o texto); normalizer usa 16 bytes de
+blake2b, que en SQLite se buscan más rápido que su versión en hex.
+record() no confirma: las filas registradas quedan en una transacción que se
+confirma con commit() recién cuando la salida quedó escrita, así una corrida
+que falla no marca nada como procesado. Mientras tanto seen() ya las ve, y una
+fila repetida más adelante en el mismo archivo también se omite.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional, Set, Tuple, Union
+
+INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".lead_index.sqlite3")
+IDENTITY_KINDS = ("telefono", "email", "rut")
+
+Fingerprint = Union[bytes, str]
+
+# Límite de variables por consulta de SQLite (999 en versiones antiguas)
+_QUERY_CHUNK = 500
+
+
+def identity_keys(telefono: str = "", email: str = "", rut: str = "") -> List[Tuple[str, str]]:
+    """Claves de identidad no vacías de un lead (teléfono ya normalizado por quien llama)."""
+    keys = []
+    telefono = str(telefono or "").strip()
+    if telefono:
+        keys.append(("telefono", telefono))
+    email = str(email or "").strip().lower()
+    if email:
+        keys.append(("email", email))
+    rut = str(rut or "").replace(".", "").replace("-", "").strip().upper()
+    if rut:
+        keys.append(("rut", rut))
+    return keys
+
+
+def _chunks(values: list):
+    for start in range(0, len(values), _QUERY_CHUNK):
+        yield values[start:start + _QUERY_CHUNK]
+
+
+class LeadIndex:
+    def __init__(self, path: str = INDEX_PATH, scope: str = "normalizer"):
+        self.scope = scope
+        self._lock = threading.Lock()
+        # timeout: otro proceso puede tener abierta su transacción (se confirma al final)
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS rows (
+                                scope TEXT NOT NULL, fp BLOB NOT NULL, source TEXT, seen_at REAL NOT NULL,
+                                PRIMARY KEY (scope, fp)) WITHOUT ROWID""")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS identities (
+                                scope TEXT NOT NULL, kind TEXT NOT NULL, value TEXT NOT NULL,
+                                fp BLOB NOT NULL, seen_at REAL NOT NULL,
+                                PRIMARY KEY (scope, kind, value)) WITHOUT ROWID""")
+        self._db.commit()
+
+    def seen(self, fingerprints: Iterable[Fingerprint]) -> Set[Fingerprint]:
+        """Las huellas que ya están en el índice."""
+        found = set()
+        with self._lock:
+            for chunk in _chunks(list(set(fingerprints))):
+                marks = ",".join("?" * len(chunk))
+                found.update(fp for (fp,) in self._db.execute(
+                    f"SELECT fp FROM rows WHERE scope = ? AND fp IN ({marks})", [self.scope, *chunk]))
+        return found
+
+    def known(self, identities: Iterable[Iterable[Tuple[str, str]]]) -> List[bool]:
+        """Por cada lead (lista de claves de identity_keys), si alguna ya está indexada."""
+        leads = [list(keys) for keys in identities]
+        by_kind = {}
+        for keys in leads:
+            for kind, value in keys:
+                by_kind.setdefault(kind, set()).add(value)
+        found = set()
+        with self._lock:
+            for kind, values in by_kind.items():
+                for chunk in _chunks(list(values)):
+                    marks = ",".join("?" * len(chunk))
+                    found.update((kind, value) for (value,) in self._db.execute(
+                        f"SELECT value FROM identities WHERE scope = ? AND kind = ? AND value IN ({marks})",
+                        [self.scope, kind, *chunk]))
+        return [any(key in found for key in keys) for keys in leads]
+
+    def record(self, entries: Iterable[Tuple[Fingerprint, Iterable[Tuple[str, str]]]],
+               source: Optional[str] = None) -> int:
+        """Registra (huella, claves de identidad) de filas escritas, sin confirmar. Retorna cuántas."""
+        now = time.time()
+        rows, ids = [], []
+        for fp, keys in entries:
+            rows.append((self.scope, fp, source, now))
+            ids.extend((self.scope, kind, value, fp, now) for kind, value in keys)
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO rows VALUES (?, ?, ?, ?)", rows)
+            self._db.executemany("INSERT OR REPLACE INTO identities VALUES (?, ?, ?, ?, ?)", ids)
+        return len(rows)
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+
+    def rollback(self):
+        with self._lock:
+            self._db.rollback()
+
+    def close(self):
+        """Cierra descartando lo registrado sin commit()."""
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,114 @@
+"""
+llm_guard.py - Timeouts adaptativos, reintentos y circuit breaker para Ollama
+=============================================================================
+Con un timeout fijo de 300 s, un Ollama colgado o saturado bloquea cada lead
+cinco minutos antes de caer a la heurística. Estas piezas acotan el daño:
+
+  - AdaptiveTimeout: el timeout de lectura sale de la latencia observada
+    (p99 de las últimas respuestas por un factor), entre un mínimo y el máximo
+    fijo. Hasta juntar suficientes muestras se usa el máximo.
+  - retry_delay: espera con jitter completo entre reintentos de errores
+    transitorios (conexión, timeout, HTTP 429 / 5xx).
+  - CircuitBreaker: tras N fallas seguidas (leads sin respuesta, ya agotados
+    sus reintentos) se abre y los leads que quedan van directo a la
+    heurística; cada probe_seconds deja pasar una sola llamada de prueba, sin
+    reintentos, y si responde se cierra y se vuelve a usar el LLM.
+
+LLMGuard junta las tres para una corrida. Todo es seguro entre workers.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from typing import Tuple
+
+from run_metrics import percentile
+
+
+class AdaptiveTimeout:
+    def __init__(self, connect: float, maximum: float, minimum: float = 20.0, factor: float = 3.0,
+                 window: int = 200, min_samples: int = 10):
+        self.connect = connect
+        self.maximum = maximum
+        self.minimum = minimum
+        self.factor = factor
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def read_timeout(self) -> float:
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return self.maximum
+            p99 = percentile(sorted(self._latencies), 99)
+        return min(self.maximum, max(self.minimum, p99 * self.factor))
+
+    def timeout(self, scale: float = 1.0) -> Tuple[float, float]:
+        """(connect, read) para requests; scale alarga la lectura (ej. varios leads en una llamada)."""
+        return self.connect, min(self.maximum, self.read_timeout() * scale)
+
+
+def retry_delay(attempt: int, base: float = 1.0, cap: float = 10.0) -> float:
+    """Segundos a esperar antes del reintento número attempt (desde 0), con jitter completo."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "cerrado", "abierto", "probando"
+
+    def __init__(self, failures: int = 5, probe_seconds: float = 30.0):
+        self.failures = failures
+        self.probe_seconds = probe_seconds
+        self.state = self.CLOSED
+        self.opened = 0
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Si esta llamada puede ir al LLM. Con el circuito abierto, solo la de prueba."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.probe_seconds:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            closed = self.state != self.CLOSED
+            self.state = self.CLOSED
+            self._consecutive = 0
+        if closed:
+            print("✅ Ollama respondió: circuito cerrado, se vuelve a usar el LLM.")
+
+    def failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and
+                                                self._consecutive >= self.failures):
+                reopened = self.state == self.HALF_OPEN
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self.opened += not reopened
+            else:
+                return
+        if not reopened:
+            print(f"⛔ Ollama: {self._consecutive} leads seguidos sin respuesta, circuito abierto. "
+                  f"Los leads siguen con heurística; se reintenta cada {self.probe_seconds:.0f}s.")
+
+
+class LLMGuard:
+    """Timeout adaptativo, reintentos y breaker compartidos por los workers de una corrida."""
+
+    def __init__(self, connect: float, maximum: float, minimum: float = 20.0, retries: int = 2,
+                 failures: int = 5, probe_seconds: float = 30.0):
+        self.timeout = AdaptiveTimeout(connect, maximum, minimum)
+        self.breaker = CircuitBreaker(failures, probe_seconds)
+        self.retries = retries
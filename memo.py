@@ -0,0 +1,146 @@
+"""
+memo.py - Limpiadores calculados una vez por valor distinto
+===========================================================
+Los exports repiten mucho: los mismos proyectos, los mismos rangos de renta
+("1.200.000_a_1.500.000") y las mismas transcripciones de bots aparecen miles
+de veces. ValueMemo aplica un limpiador solo a los valores distintos y
+reparte el resultado a todas las filas que lo comparten:
+
+  - memo.map(series): factoriza la columna, limpia los valores únicos que
+    no están en el memo (con la versión por columna si existe) y arma la
+    columna completa a partir de los códigos
+  - memo(valor): una celda a la vez, para los lectores que van fila por fila
+
+El memo es un LRU acotado a maxsize valores, así que en modo streaming se
+reutiliza entre chunks sin crecer con el archivo. Es seguro entre hilos.
+
+Un hit es una celda cuyo resultado no hubo que calcular (repetida dentro de
+la columna o ya vista en un chunk anterior); un miss es un valor calculado.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+MEMO_MAX_VALUES = 50_000
+
+_MISSING = object()
+
+
+def text_memo_size(maxsize: int) -> int:
+    """Tope de los memos de transcripciones: clave y resultado pesan KB, se guarda la décima parte."""
+    return maxsize // 10
+
+
+class ValueMemo:
+    def __init__(self, name: str, fn: Callable, column_fn: Optional[Callable] = None,
+                 maxsize: int = MEMO_MAX_VALUES):
+        self.name = name
+        self.fn = fn
+        self.column_fn = column_fn
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, value):
+        key = (type(value), value)
+        with self._lock:
+            result = self._values.get(key, _MISSING)
+            if result is not _MISSING:
+                self._values.move_to_end(key)
+                self.hits += 1
+                return result
+        result = self.fn(value)
+        with self._lock:
+            self.misses += 1
+            self._store(key, result)
+        return result
+
+    def _store(self, key, result):
+        if self.maxsize <= 0:
+            return
+        self._values[key] = result
+        if len(self._values) > self.maxsize:
+            self._values.popitem(last=False)
+
+    def _clean(self, series: "pd.Series") -> "pd.Series":
+        return self.column_fn(series) if self.column_fn else series.apply(self.fn)
+
+    def map(self, series: "pd.Series", metrics=None) -> "pd.Series":
+        """
+        Igual que aplicar el limpiador a toda la columna, calculando cada valor
+        distinto una sola vez. Las columnas object con valores que no son texto
+        se limpian directo: 1 y 1.0 serían la misma clave con resultados distintos.
+        Entre columnas no chocan: las claves del memo llevan el tipo del valor,
+        así que lo que deja una columna int64 no lo lee una float64.
+        """
+        # pandas solo hace falta aquí: ai_normalizer usa el memo por celda sin importarlo
+        import numpy as np
+        import pandas as pd
+
+        if series.empty or (series.dtype == object and
+                            pd.api.types.infer_dtype(series, skipna=True) not in ("string", "empty")):
+            result = self._clean(series)
+            self._count(0, len(series), metrics)
+            return result
+
+        codes, uniques = pd.factorize(series)
+        # Un lugar extra al final para los nulos (código -1)
+        table = np.empty(len(uniques) + 1, dtype=object)
+        missing = range(len(uniques))
+        if self._values:  # Con el memo vacío no hay nada que buscar
+            missing = []
+            with self._lock:
+                for i, value in enumerate(uniques.tolist()):
+                    key = (type(value), value)
+                    result = self._values.get(key, _MISSING)
+                    if result is _MISSING:
+                        missing.append(i)
+                    else:
+                        self._values.move_to_end(key)
+                        table[i] = result
+
+        computed = len(missing)
+        integer = None
+        if computed:
+            subset = uniques if computed == len(uniques) else uniques.take(missing)
+            cleaned = self._clean(pd.Series(subset))
+            integer = cleaned.dtype.kind in "iu"
+            table[np.asarray(missing)] = cleaned.to_numpy(dtype=object)
+            if self.maxsize > 0:
+                # Solo los últimos maxsize quedarían en el LRU de todas formas
+                kept = np.asarray(missing[-self.maxsize:])
+                with self._lock:
+                    for value, result in zip(uniques.take(kept).tolist(), table[kept]):
+                        self._store((type(value), value), result)
+        nulls = codes == -1
+        if nulls.any():
+            null_result = self._clean(series[nulls].iloc[:1])
+            integer = null_result.dtype.kind in "iu" if integer is None else integer
+            table[-1] = null_result.iloc[0]
+            computed += 1
+        self._count(len(series) - computed, computed, metrics)
+
+        result = pd.Series(table.take(codes), index=series.index, dtype=object)
+        if integer is None:
+            # Todo vino del memo: se infiere el tipo de los valores guardados
+            integer = all(isinstance(v, (int, np.integer)) and not isinstance(v, bool) for v in table[:-1])
+        if integer:
+            try:
+                return result.astype("int64")
+            except OverflowError:
+                pass  # Enteros más allá de int64, igual que el limpiador directo
+        return result
+
+    def _count(self, hits: int, misses: int, metrics=None):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+        if metrics is not None:
+            metrics.observe_memo(self.name, hits, misses)
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
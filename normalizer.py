@@ -3,7 +3,25 @@ import re
 import sys
 import os
 import argparse
-import json
+import codecs
+import csv
+import glob
+import hashlib
+import io
+import itertools
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+
+from pandas.io.parsers import TextParser
+
+from compact import compact_frame, frame_memory, reduction
+from lead_index import INDEX_PATH, LeadIndex, identity_keys
+from memo import MEMO_MAX_VALUES, ValueMemo, text_memo_size
+from pg_copy import BATCH_ROWS as PG_BATCH_ROWS, copy_block, export_copy
+from run_metrics import RunMetrics
+from transcript import decode_transcript
 
 # --- CONFIGURATION: KEYWORD MAPPING ---
 # Define keywords that map to our target schema columns.
@@ -19,6 +37,9 @@ COLUMN_MAPPING = {
     'observacion': ['observacion', 'nota', 'comentario', 'detalle']
 }
 
+# Free-text columns scanned for emails when the email column is empty
+EMAIL_SCAN_COLUMNS = ['transcripcion', 'observacion', 'notas', 'message', 'mensaje']
+
 def clean_phone(phone_str):
     if pd.isna(phone_str): return ""
     # Remove non-digits
@@ -86,16 +107,109 @@ def extract_email_from_text(text):
         return match.group(0)
     return ""
 
+# --- COLUMN-WIDE CLEANERS ---
+# Same rules as clean_phone / clean_rent / clean_email above, applied to a whole
+# Series at once with pandas .str methods and boolean masks instead of one Python
+# call per cell. Output is identical to Series.apply(<per-cell cleaner>).
+try:
+    import pyarrow  # noqa: F401  Optional: Arrow string kernels make the .str calls native
+    FAST_STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    FAST_STRING_DTYPE = object
+
+EMAIL_PATTERN = r"[a-z0-9][\w\.-]*@[\w\.-]+\.\w+"
+RENT_TOKEN_PATTERN = r"([\d.]*\d[\d.]*)"
+# Everything up to and including the first candidate; (?s) so it crosses newlines
+# the same way str.extract does
+RENT_PREFIX_PATTERN = f"(?s)^.*?{RENT_TOKEN_PATTERN}"
+
+def _split_for_cleaning(series, cleaner, empty):
+    """
+    Returns (text, result): `text` holds the non-null ASCII cells as strings,
+    ready for column-wide cleaning; `result` is pre-filled for every other cell
+    by the per-cell `cleaner` (nulls, and non-ASCII text where the regex engines
+    disagree on Unicode digits and case folding). Rows in `text` start as `empty`.
+    """
+    text = series[series.notna()].astype(str).astype(FAST_STRING_DTYPE)
+    text = text[text.str.isascii().astype(bool)]
+    result = pd.Series(empty, index=series.index, dtype=object)
+    rest = series.index.difference(text.index, sort=False)
+    if len(rest):
+        result.loc[rest] = series.loc[rest].apply(cleaner)
+    return text, result
+
+def clean_phone_column(series):
+    text, result = _split_for_cleaning(series, clean_phone, "")
+    digits = text.str.replace(r'\D', '', regex=True)
+    length = digits.str.len()
+
+    # Chile specific rules (anything else is returned as bare digits)
+    phone = digits.copy()
+    local = (length == 8).astype(bool)
+    mobile = ((length == 9) & digits.str.startswith('9')).astype(bool)
+    full = ((length == 11) & digits.str.startswith('569')).astype(bool)
+    phone[local] = "+569" + digits[local]
+    phone[mobile] = "+56" + digits[mobile]
+    phone[full] = "+" + digits[full]
+    result.loc[phone.index] = phone.astype(object)
+    return result
+
+def _above_1000(digits):
+    # Compared on the digit string so arbitrarily long numbers cannot overflow
+    significant = digits.str.lstrip('0')
+    length = significant.str.len()
+    return ((length > 4) | ((length == 4) & (significant != '1000'))).astype(bool)
+
+def clean_rent_column(series):
+    pending, result = _split_for_cleaning(series, clean_rent, 0)
+    found = []
+
+    # Walk the candidate numbers left to right; each pass only touches rows whose
+    # previous candidate was <= 1000. A candidate is a run of digits/dots.
+    while not pending.empty:
+        token = pending.str.extract(RENT_TOKEN_PATTERN, expand=False)
+        has_token = token.notna().astype(bool)
+        pending, token = pending[has_token], token[has_token]
+        digits = token.str.replace('.', '', regex=False)
+        hit = _above_1000(digits)
+        found.append(digits[hit])
+        rest = pending[~hit]
+        pending = rest.str.replace(RENT_PREFIX_PATTERN, '', n=1, regex=True)
+        # Safety net: a row the prefix pattern did not shorten would loop forever,
+        # so it falls back to the per-cell cleaner
+        stuck = (pending.str.len() >= rest.str.len()).astype(bool)
+        if stuck.any():
+            result.loc[rest.index[stuck]] = rest[stuck].astype(object).map(clean_rent)
+            pending = pending[~stuck]
+
+    if found:
+        values = pd.concat(found).astype(object)
+        result.loc[values.index] = values.map(int)
+    try:
+        return result.astype('int64')
+    except OverflowError:
+        return result  # Python ints beyond int64, same as Series.apply(clean_rent)
+
+def clean_email_column(series, cleaner=clean_email):
+    text, result = _split_for_cleaning(series, cleaner, "")
+    found = text.str.lower().str.extract(f"({EMAIL_PATTERN})", expand=False)
+    result.loc[found.index] = found.fillna("").astype(object)
+    return result
+
+def extract_email_column(series):
+    return clean_email_column(series, cleaner=extract_email_from_text)
+
 def summarize_chat(chat_content):
     if pd.isna(chat_content) or not str(chat_content).strip():
         return ""
     
     s = str(chat_content).strip()
     
-    # Check if it's JSON
-    if (s.startswith('[') and s.endswith(']')) or (s.startswith('{') and s.endswith('}')):
+    # Check if it's a chat transcript (valid JSON, or a broken payload the shared
+    # decoder can still pull sender/message pairs out of)
+    if s.startswith(('[', '{')) or 'sender' in s:
         try:
-            data = json.loads(s)
+            data = decode_transcript(s)
             if isinstance(data, list):
                 summary_parts = []
                 user_msgs = [m['message'] for m in data if m.get('sender') == 'user']
@@ -141,84 +255,370 @@ def summarize_chat(chat_content):
     clean = re.sub(r'"sender":"(.*?)"', r'(\1):', clean)
     return clean.strip()
 
-def normalize_file(input_path, output_path=None):
-    print(f"Propcessing: {input_path}")
-    
+# --- MEMOIZED CLEANERS ---
+# Each cleaner runs once per distinct value of a column and the results are
+# mapped back to every row (see memo.py). Streaming mode keeps the same memos
+# across chunks, bounded to memo_size values each; transcript memos keep
+# fewer (text_memo_size) since each entry is a few KB.
+def cleaner_memos(memo_size=MEMO_MAX_VALUES):
+    text_size = text_memo_size(memo_size)
+    return {
+        'telefono': ValueMemo('clean_phone', clean_phone, clean_phone_column, memo_size),
+        'renta': ValueMemo('clean_rent', clean_rent, clean_rent_column, memo_size),
+        'email': ValueMemo('clean_email', clean_email, clean_email_column, memo_size),
+        'extract_email': ValueMemo('extract_email_from_text', extract_email_from_text,
+                                   extract_email_column, text_size),
+        'observacion': ValueMemo('summarize_chat', summarize_chat, maxsize=text_size),
+    }
+
+# --- READING ---
+# CSV cells are read as text so a column's values do not depend on what else is
+# in the file (a phone column with one blank would otherwise turn into floats).
+# The same holds chunk by chunk in streaming mode.
+#
+# Encoding and delimiter are sniffed from the first SNIFF_BYTES, so a
+# Latin-1/semicolon export is parsed once instead of failing as UTF-8 first.
+# The fixed fallback is only tried if the sniffed options still fail.
+SNIFF_BYTES = 64 * 1024
+SNIFF_ROWS = 1000
+CSV_DELIMITERS = ',;\t|'
+CSV_FALLBACK = {'dtype': str, 'sep': ';', 'encoding': 'latin-1'}
+
+def _delimiter_counts(line):
+    counts = dict.fromkeys(CSV_DELIMITERS, 0)
+    quoted = False
+    for ch in line:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch in counts:
+            counts[ch] += 1
+    return counts
+
+def sniff_csv(input_path):
+    """Read options (encoding, delimiter) chosen from the start of the file."""
+    with open(input_path, 'rb') as f:
+        sample = f.read(SNIFF_BYTES)
     try:
-        # 1. Detect file type and read
-        if input_path.endswith(('.xls', '.xlsx')):
-            df = pd.read_excel(input_path)
-        elif input_path.endswith('.csv'):
-            # Try reading with different encodings/separators if needed, defaulting to standard
-            try:
-                df = pd.read_csv(input_path)
-            except:
-                df = pd.read_csv(input_path, sep=';', encoding='latin-1')
-                
-            # Check for "swallowed" CSV (single column containing the whole row)
-            # This happens if rows are incorrectly wrapped in outer quotes
-            if len(df.columns) > 1:
-                # Heuristic: Column 0 has commas, Column 1 is mostly Empty/NaN
-                col0 = df.iloc[:, 0].astype(str)
-                col1_nulls = df.iloc[:, 1].isna().sum()
-                total_rows = len(df)
-                
-                # Check for commas in first row of data
-                has_commas = ',' in str(col0.iloc[0]) if len(col0) > 0 else False
-                
-                if has_commas and (col1_nulls > total_rows * 0.9):
-                    print("Detected 'swallowed' CSV rows. Applying double-parsing fix...")
-                    try:
-                        import io
-                        # Reconstruct CSV from column 0 values
-                        # Use the original headers
-                        content = "\n".join(col0)
-                        df_fixed = pd.read_csv(io.StringIO(content), header=None, names=df.columns)
-                        df = df_fixed
-                        print("Double-parsing successful. Shape:", df.shape)
-                    except Exception as e:
-                        print(f"Double-parsing failed: {e}. Continuing with original DF.")
-                        
-        else:
-            print("Error: Unsupported file format. Use .csv or .xlsx")
-            return
+        # final=False: a multi-byte character cut at the end of the sample is fine
+        text = codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        encoding = 'utf-8'
+    except UnicodeDecodeError:
+        text = sample.decode('latin-1')
+        encoding = 'latin-1'
+    lines = text.lstrip('\ufeff').splitlines()
+    counts = _delimiter_counts(lines[0] if lines else '')
+    # Ties go to the comma, the first candidate
+    sep = max(CSV_DELIMITERS, key=counts.get) if any(counts.values()) else ','
+    return {'dtype': str, 'sep': sep, 'encoding': encoding}
 
-    except Exception as e:
-        print(f"Error reading file: {e}")
-        return
+def csv_read_attempts(options):
+    """Sniffed options, then Latin-1 (bad bytes past the sample), then the fixed fallback."""
+    attempts = []
+    for candidate in (options, {**options, 'encoding': 'latin-1'}, CSV_FALLBACK):
+        if candidate not in attempts:
+            attempts.append(candidate)
+    return attempts
 
-    # 2. Normalize Columns
-    df.columns = [c.strip().lower() for c in df.columns]
+def is_swallowed(df):
+    """
+    Detects a "swallowed" CSV (single column containing the whole row).
+    This happens if rows are incorrectly wrapped in outer quotes.
+    """
+    if len(df.columns) <= 1:
+        return False
+    # Heuristic: Column 0 has commas, Column 1 is mostly Empty/NaN
+    col0 = df.iloc[:, 0].astype(str)
+    col1_nulls = df.iloc[:, 1].isna().sum()
+    total_rows = len(df)
+
+    # Check for commas in first row of data
+    has_commas = ',' in str(col0.iloc[0]) if len(col0) > 0 else False
+    return has_commas and (col1_nulls > total_rows * 0.9)
+
+class SwallowedRows(io.TextIOBase):
+    """
+    Text stream over a swallowed CSV for pd.read_csv: the header, then the
+    first field of each record, i.e. the real row without its outer quotes.
+    Rows are unwrapped as pandas reads, so the file is parsed in one pass.
+    """
+
+    def __init__(self, input_path, encoding, sep):
+        # utf-8-sig drops a BOM, as pandas does
+        self._file = open(input_path, encoding='utf-8-sig' if encoding == 'utf-8' else encoding,
+                          newline='')
+        self._records = csv.reader(self._file, delimiter=sep)
+        header = io.StringIO()
+        csv.writer(header, lineterminator='\n').writerow(next(self._records, []))
+        self._buffer = header.getvalue()
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        parts, length = [self._buffer], len(self._buffer)
+        for record in self._records:
+            if not record:
+                continue  # blank line
+            # An empty first field still stands for a (blank) row
+            line = (record[0] or '""') + '\n'
+            parts.append(line)
+            length += len(line)
+            if 0 <= size <= length:
+                break
+        data = ''.join(parts)
+        if size < 0:
+            self._buffer = ''
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+def read_csv_once(input_path, options, chunksize=None):
+    """
+    One full parse with the given options (a chunk reader with chunksize).
+    Swallowed rows are detected on the first SNIFF_ROWS rows and unwrapped
+    while streaming; their inner delimiter is always a comma.
+    """
+    head = pd.read_csv(input_path, nrows=SNIFF_ROWS, **options)
+    if is_swallowed(head):
+        print("Detected 'swallowed' CSV rows. Unwrapping them while reading...")
+        source = SwallowedRows(input_path, options['encoding'], options['sep'])
+        if chunksize:
+            return pd.read_csv(source, chunksize=chunksize, dtype=str)
+        try:
+            with source:
+                return pd.read_csv(source, dtype=str)
+        except Exception as e:
+            print(f"Unwrapping failed: {e}. Continuing with the rows as read.")
+    return pd.read_csv(input_path, chunksize=chunksize, **options)
+
+# Excel exports carry many columns we never use. The header row is read first,
+# the column mapping resolved on it, and only the columns clean_frame reads are
+# converted, a chunk of rows at a time. python-calamine (Rust) parses the sheet
+# when it is installed; otherwise openpyxl streams it in read-only mode. Either
+# way the frame is the one pd.read_excel would return, minus the unused columns.
+try:
+    import python_calamine  # noqa: F401  Optional: ~8x faster than openpyxl
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = "openpyxl"
+
+EXCEL_CHUNK_ROWS = 20_000
+
+def needed_columns(columns, renamed_cols):
+    """
+    Positions of the headers clean_frame reads: the mapped ones, the text
+    columns scanned for emails and any header already named like a target.
+    At least one column is kept so the row count survives.
+    """
+    keep = []
+    for i, col in enumerate(columns):
+        name = str(col).strip().lower()
+        if name in renamed_cols or name in COLUMN_MAPPING or any(x in name for x in EMAIL_SCAN_COLUMNS):
+            keep.append(i)
+    return keep or [0]
+
+def _open_sheet(input_path, engine):
+    """
+    Returns (rows, convert): the raw rows of the first sheet and the cell
+    conversion pd.read_excel applies for that engine.
+    """
+    if engine == "calamine":
+        from python_calamine import CalamineWorkbook
+
+        def convert(value):
+            if isinstance(value, float):
+                val = int(value)
+                return val if val == value else value
+            if type(value) is date:
+                return datetime(value.year, value.month, value.day)
+            return value
+
+        return CalamineWorkbook.from_path(input_path).get_sheet_by_index(0).iter_rows(), convert
+
+    from openpyxl import load_workbook
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+    def convert(cell):
+        value = cell.value
+        if value is None:
+            return ""
+        if cell.data_type == TYPE_ERROR:
+            return float("nan")
+        if cell.data_type == TYPE_NUMERIC:
+            val = int(value)
+            return val if val == value else float(value)
+        return value
+
+    def rows():
+        wb = load_workbook(input_path, read_only=True, data_only=True)
+        try:
+            ws = wb.worksheets[0]
+            ws.reset_dimensions()
+            blank = 0
+            for row in ws.rows:
+                if all(c.value is None or c.value == "" for c in row):
+                    blank += 1
+                    continue
+                yield from [()] * blank
+                blank = 0
+                yield row
+            # Trailing empty rows are dropped, as pd.read_excel does
+        finally:
+            wb.close()
+
+    return rows(), convert
+
+def _excel_names(header):
+    # Same names pd.read_excel gives: blanks become 'Unnamed: i', duplicates 'x.1'
+    return list(TextParser([list(header)], header=0).read().columns)
+
+def _parse_rows(rows, names):
+    # Same parser and options pd.read_excel uses, so dtypes are inferred alike
+    return TextParser(rows, names=names, header=None, skip_blank_lines=False).read()
+
+def _kept_rows(rows, convert, keep):
+    for row in rows:
+        n = len(row)
+        yield [convert(row[i]) if i < n else "" for i in keep]
+
+def _frame_in_chunks(rows, names):
+    """
+    Parses the rows EXCEL_CHUNK_ROWS at a time, so only one chunk of Python
+    objects is alive at once. pd.read_excel infers each dtype over the whole
+    column: also returns the columns whose chunks disagree, to be re-parsed.
+    """
+    parts = []
+    while True:
+        chunk = list(itertools.islice(rows, EXCEL_CHUNK_ROWS))
+        if not chunk:
+            break
+        parts.append(_parse_rows(chunk, names))
+    if len(parts) <= 1:
+        return (parts[0] if parts else _parse_rows([], names)), []
+    mixed = [name for j, name in enumerate(names)
+             if any(p.dtypes.iloc[j] != parts[0].dtypes.iloc[j] for p in parts[1:])]
+    return pd.concat(parts, ignore_index=True), mixed
+
+def read_excel_pruned(input_path, engine=None):
+    """pd.read_excel(input_path) restricted to the columns the normalizer uses."""
+    engine = engine or EXCEL_ENGINE
+    rows, convert = _open_sheet(input_path, engine)
+    header = [convert(c) for c in next(rows, ())]
+    # openpyxl rows stop at their last value; pandas pads them to the widest
+    # row, and cells past the header end up as 'Unnamed: i' columns
+    trim = engine == "openpyxl"
+    while trim and header and header[-1] == "":
+        header.pop()
+    if not header:
+        return pd.read_excel(input_path, engine=engine)
+    names = _excel_names(header)
+    keep = needed_columns(names, map_columns(names))
+
+    width = len(header)
+    def data():
+        nonlocal width
+        for row in rows:
+            used = len(row)
+            while trim and used > width and convert(row[used - 1]) == "":
+                used -= 1
+            width = max(width, used)
+            yield row
+    df, reparse = _frame_in_chunks(_kept_rows(data(), convert, keep), [names[i] for i in keep])
+
+    if width > len(header):
+        names = _excel_names(header + [""] * (width - len(header)))
+        reparse += [names[i] for i in needed_columns(names, map_columns(names)) if i >= len(header)]
+    if reparse:
+        # Rare: dtype differs between chunks, or data wider than the header.
+        # Those columns are read again and parsed in one go.
+        positions = [names.index(name) for name in reparse]
+        rows, convert = _open_sheet(input_path, engine)
+        next(rows, None)
+        fixed = _parse_rows(list(_kept_rows(rows, convert, positions)), reparse)
+        for name in reparse:
+            df[name] = fixed[name]
+    return df
+
+def read_input(input_path):
+    # 1. Detect file type and read
+    if input_path.endswith('.xlsx'):
+        return read_excel_pruned(input_path)
+    if input_path.endswith('.xls'):
+        return pd.read_excel(input_path)
+
+    options = sniff_csv(input_path)
+    print(f"Detected CSV: encoding={options['encoding']}, separator={options['sep']!r}")
+    attempts = csv_read_attempts(options)
+    for attempt, read_options in enumerate(attempts):
+        try:
+            return read_csv_once(input_path, read_options)
+        except Exception:
+            if attempt == len(attempts) - 1:
+                raise
+
+# --- CLEANING ---
+def map_columns(columns):
+    """Returns {original (lowercased) header: target column} using COLUMN_MAPPING."""
+    columns = [c.strip().lower() for c in columns]
     renamed_cols = {}
-    
-    found_cols = []
-    
     for target, keywords in COLUMN_MAPPING.items():
-        for col in df.columns:
+        for col in columns:
             if any(k in col for k in keywords):
                 renamed_cols[col] = target
-                found_cols.append(target)
                 break # Map the first matching column found for this target
-    
-    print(f"Mapped columns: {renamed_cols}")
+    return renamed_cols
+
+def recover_missing_emails(df, text_cols, extract=extract_email_column):
+    """
+    Fills empty 'email' cells in place from text_cols. Only rows still missing
+    an email are scanned, one text column at a time in column order; later
+    columns only see the rows still empty.
+    """
+    missing = df['email'] == ""
+    for col in text_cols:
+        if not missing.any():
+            break
+        extracted = extract(df.loc[missing, col])
+        extracted = extracted[extracted != ""]
+        df.loc[extracted.index, 'email'] = extracted
+        missing.loc[extracted.index] = False
+    return df
+
+def clean_frame(df, renamed_cols, verbose=True, metrics=None, memos=None):
+    """
+    Steps 2-6 of normalize_file on an already-read frame (or chunk). Pass the
+    same memos (see cleaner_memos) for every chunk of a file.
+    """
+    log = print if verbose else (lambda *args, **kwargs: None)
+    metrics = metrics or RunMetrics("normalizer")
+    memos = memos or cleaner_memos()
+    rows = len(df)
+
+    # 2. Normalize Columns
+    df.columns = [c.strip().lower() for c in df.columns]
     df = df.rename(columns=renamed_cols)
 
     # 3. Create missing columns as empty
     required_cols = ['nombre', 'email', 'telefono', 'renta', 'proyecto']
     for col in required_cols:
         if col not in df.columns:
-            print(f"Warning: Column '{col}' not found. Creating empty.")
+            log(f"Warning: Column '{col}' not found. Creating empty.")
             df[col] = ""
 
     # 4. Clean Data
-    if 'telefono' in df.columns:
-        df['telefono'] = df['telefono'].apply(clean_phone)
-    
-    if 'renta' in df.columns:
-        df['renta'] = df['renta'].apply(clean_rent)
-        
-    if 'email' in df.columns:
-        df['email'] = df['email'].apply(clean_email)
+    with metrics.stage("clean", rows):
+        if 'telefono' in df.columns:
+            df['telefono'] = memos['telefono'].map(df['telefono'], metrics)
+
+        if 'renta' in df.columns:
+            df['renta'] = memos['renta'].map(df['renta'], metrics)
+
+        if 'email' in df.columns:
+            df['email'] = memos['email'].map(df['email'], metrics)
         
     # Fallback: Extract email from text columns if email is empty
     # Common columns that might contain hidden emails: 'transcripcion', 'observacion'
@@ -229,7 +629,7 @@ def normalize_file(input_path, output_path=None):
     # Let's check for 'transcripcion' specifically as per user case, or just scan all object columns?
     # Better to be specific if we can.
     
-    text_cols_to_scan = ['transcripcion', 'observacion', 'notas', 'message', 'mensaje']
+    text_cols_to_scan = EMAIL_SCAN_COLUMNS
     # Check which of these exist in df (even if not mapped to target schema yet)
     # Wait, strictly speaking we renamed everything.
     # But unmapped columns are still there if we didn't drop them yet.
@@ -239,14 +639,10 @@ def normalize_file(input_path, output_path=None):
     possible_text_cols = [c for c in df.columns if any(x in c for x in text_cols_to_scan)]
     
     if 'email' in df.columns and len(possible_text_cols) > 0:
-        print(f"Scanning for emails in text columns: {possible_text_cols}...")
-        for idx, row in df.iterrows():
-            if not row['email']: # If email is missing
-                for col in possible_text_cols:
-                    extracted = extract_email_from_text(row[col])
-                    if extracted:
-                        df.at[idx, 'email'] = extracted
-                        break
+        log(f"Scanning for emails in text columns: {possible_text_cols}...")
+        with metrics.stage("extract", rows):
+            recover_missing_emails(df, possible_text_cols,
+                                   lambda series: memos['extract_email'].map(series, metrics))
         
     # Merge Name and Last Name if separate
     if 'apellido' in df.columns and 'nombre' in df.columns:
@@ -281,18 +677,348 @@ def normalize_file(input_path, output_path=None):
     
     # 6. Apply intelligent summary to 'observacion'
     if 'observacion' in final_df.columns:
-        print("Creating human-readable summaries for 'observacion'...")
-        final_df['observacion'] = final_df['observacion'].apply(summarize_chat)
-    
+        log("Creating human-readable summaries for 'observacion'...")
+        with metrics.stage("summarize", rows):
+            final_df['observacion'] = memos['observacion'].map(final_df['observacion'], metrics)
+
+    return final_df
+
+def compact_read_frame(df, renamed_cols):
+    """
+    Compact dtypes for a freshly read frame (see compact.py). Columns that
+    clean_frame rewrites or scans stay as read; the project column becomes
+    categorical and the remaining text is categorical or Arrow-backed.
+    """
+    keep, categories = [], []
+    for col in df.columns:
+        name = col.strip().lower()
+        target = renamed_cols.get(name)
+        if target == 'proyecto':
+            categories.append(col)
+        elif target or name in COLUMN_MAPPING or any(x in name for x in EMAIL_SCAN_COLUMNS):
+            keep.append(col)
+    return compact_frame(df, categories=categories, keep=keep)
+
+def _compacted(df, compact_fn, label, metrics):
+    with metrics.stage("compact", len(df)):
+        before = frame_memory(df)
+        df = compact_fn(df)
+        after = frame_memory(df)
+    print(f"Memory ({label}): {before / 2**20:.1f} MB -> {after / 2**20:.1f} MB "
+          f"({-reduction(before, after):+.0f}%)")
+    metrics.incr(f"{label.replace(' ', '_')}_bytes", before)
+    metrics.incr(f"{label.replace(' ', '_')}_bytes_compact", after)
+    return df
+
+# --- INCREMENTAL MODE ---
+def row_fingerprints(df):
+    """
+    A 16-byte fingerprint per raw row (values as read, header included), so the
+    same row hashes the same in every run and in both the full and streaming paths.
+    """
+    header = "\x1f".join(map(str, df.columns)) + "\x1e"
+    values = df.fillna("").astype(str)
+    columns = [values[col].tolist() for col in values.columns]
+    return [hashlib.blake2b((header + "\x1f".join(row)).encode(), digest_size=16).digest()
+            for row in zip(*columns)]
+
+def incremental_rows(df, index, metrics):
+    """
+    Drops the rows already in the lead index (or repeated earlier in this
+    run). Returns the remaining rows and their fingerprints.
+    """
+    with metrics.stage("fingerprint", len(df)):
+        fingerprints = row_fingerprints(df)
+        skip = index.seen(fingerprints)
+        fresh = []
+        for fp in fingerprints:
+            fresh.append(fp not in skip)
+            skip.add(fp)
+    kept = [fp for fp, keep in zip(fingerprints, fresh) if keep]
+    metrics.incr("incremental_unchanged", len(fingerprints) - len(kept))
+    return df[fresh], kept
+
+def index_rows(index, final_df, fingerprints, source, metrics):
+    """
+    Records written rows in the lead index (uncommitted) and counts them as
+    new or changed: a row is changed when its phone or email was seen before.
+    Exports have no RUT column, so identity is phone and email only.
+    """
+    keys = [identity_keys(telefono, email)
+            for telefono, email in zip(final_df['telefono'].fillna("").astype(str).tolist(),
+                                       final_df['email'].fillna("").astype(str).tolist())]
+    changed = sum(index.known(keys))
+    index.record(zip(fingerprints, keys), source)
+    metrics.incr("incremental_new", len(keys) - changed)
+    metrics.incr("incremental_changed", changed)
+
+def _print_incremental(metrics):
+    counters = metrics.counters
+    print(f"Incremental: {counters.get('incremental_new', 0)} new, "
+          f"{counters.get('incremental_changed', 0)} changed, "
+          f"{counters.get('incremental_unchanged', 0)} unchanged rows skipped")
+
+def _normalize_to_csv(input_path, output_path, chunksize, metrics, compact, memo_size, memos, index):
+    # Read, clean and write steps of normalize_file; returns True on success
+    if chunksize and input_path.endswith('.csv'):
+        return normalize_csv_streaming(input_path, output_path, chunksize, metrics, memo_size, memos, index)
+    try:
+        with metrics.stage("read", 0):
+            df = read_input(input_path)
+    except Exception as e:
+        print(f"Error reading file: {e}")
+        return False
+    metrics.add_time("read", 0, len(df))
+
+    with metrics.stage("map"):
+        renamed_cols = map_columns(df.columns)
+    print(f"Mapped columns: {renamed_cols}")
+    if index:
+        df, fingerprints = incremental_rows(df, index, metrics)
+    if compact:
+        df = _compacted(df, lambda d: compact_read_frame(d, renamed_cols), "read frame", metrics)
+    final_df = clean_frame(df, renamed_cols, metrics=metrics, memos=memos or cleaner_memos(memo_size))
+    del df
+    if compact:
+        final_df = _compacted(final_df, lambda d: compact_frame(d, categories=['proyecto'],
+                                                                integers=['renta']),
+                              "output frame", metrics)
+
+    with metrics.stage("write", len(final_df)):
+        final_df.to_csv(output_path, index=False, encoding='utf-8')
+    if index:
+        index_rows(index, final_df, fingerprints, os.path.basename(input_path), metrics)
+    print(f"Success! Normalized file saved to: {output_path}")
+    return True
+
+def normalize_file(input_path, output_path=None, chunksize=None,
+                   report_json=None, prom_textfile=None,
+                   copy_output=None, pg_dsn=None, pg_table='leads', pg_batch_rows=PG_BATCH_ROWS,
+                   compact=False, memo_size=MEMO_MAX_VALUES, memos=None,
+                   incremental=False, index_path=INDEX_PATH):
+    """
+    Normalizes one export. With copy_output and/or pg_dsn the result is also
+    written as a COPY stream for the leads table and/or loaded into Postgres.
+    With compact, the read and output frames use compact dtypes and their
+    memory before/after is reported (non-streaming path only). memo_size
+    bounds each cleaner's memo (see cleaner_memos); a long-running caller can
+    pass its own memos to keep them across files. With incremental, only rows
+    that are not in the lead index at index_path (see lead_index.py) are
+    cleaned and written, and they are added to it once the output is written.
+    Returns the output path, or None if it failed.
+    """
+    print(f"Propcessing: {input_path}")
+    metrics = RunMetrics("normalizer")
+
+    if not input_path.endswith(('.xls', '.xlsx', '.csv')):
+        print("Error: Unsupported file format. Use .csv or .xlsx")
+        return None
+
     if not output_path:
         base, ext = os.path.splitext(input_path)
         output_path = f"{base}_normalized.csv"
-        
-    final_df.to_csv(output_path, index=False, encoding='utf-8')
-    print(f"Success! Normalized file saved to: {output_path}")
+
+    index = LeadIndex(index_path, scope="normalizer") if incremental else None
+    try:
+        if not _normalize_to_csv(input_path, output_path, chunksize, metrics, compact, memo_size, memos, index):
+            return None
+        if index:
+            index.commit()
+            _print_incremental(metrics)
+    finally:
+        if index:
+            index.close()
+
+    if copy_output or pg_dsn:
+        try:
+            with metrics.stage("copy", 0):
+                rows = export_copy(_output_copy_blocks(output_path, pg_batch_rows), copy_output,
+                                   pg_dsn, pg_table, pg_batch_rows, metrics)
+            metrics.add_time("copy", 0, rows or 0)
+        except Exception as e:
+            print(f"Error exporting to Postgres COPY: {e}")
+            return None
+
+    metrics.print_summary()
+    if report_json:
+        metrics.write_json(report_json)
+    if prom_textfile:
+        metrics.write_prometheus(prom_textfile)
+    return output_path
+
+def _output_copy_blocks(output_path, batch_rows):
+    # Reads the written CSV back as text, so the COPY rows match it exactly
+    for chunk in pd.read_csv(output_path, dtype=str, keep_default_na=False, chunksize=batch_rows):
+        yield copy_block({col: chunk[col].tolist() for col in chunk.columns}, len(chunk)), len(chunk)
+
+def normalize_csv_streaming(input_path, output_path, chunksize, metrics=None, memo_size=MEMO_MAX_VALUES,
+                            memos=None, index=None):
+    """
+    Streaming variant of normalize_file for CSVs too large to hold in memory:
+    columns are mapped once from the header, then each chunk is cleaned and
+    appended to the output. Peak memory depends on chunksize, not file size,
+    and the output is byte-identical to the non-streaming path. With a lead
+    index, each chunk keeps only its new or changed rows (see normalize_file).
+    Returns True on success.
+    """
+    metrics = metrics or RunMetrics("normalizer")
+    attempts = csv_read_attempts(sniff_csv(input_path))
+    for attempt, read_options in enumerate(attempts):
+        rows = 0
+        renamed_cols = None
+        attempt_memos = memos or cleaner_memos(memo_size)
+        if index:
+            index.rollback()  # Rows recorded by a failed attempt
+        try:
+            # Output is (re)opened here so a retry with the fallback
+            # encoding/separator starts from a clean file
+            with open(output_path, 'w', encoding='utf-8', newline='') as out:
+                chunks = metrics.timed_iter("read", read_csv_once(input_path, read_options, chunksize), len)
+                for chunk in chunks:
+                    first = renamed_cols is None
+                    if first:
+                        with metrics.stage("map"):
+                            renamed_cols = map_columns(chunk.columns)
+                        print(f"Mapped columns: {renamed_cols}")
+                    if index:
+                        chunk, fingerprints = incremental_rows(chunk, index, metrics)
+                    final_df = clean_frame(chunk, renamed_cols, verbose=first, metrics=metrics, memos=attempt_memos)
+                    with metrics.stage("write", len(final_df)):
+                        final_df.to_csv(out, index=False, header=first)
+                    if index:
+                        index_rows(index, final_df, fingerprints, os.path.basename(input_path), metrics)
+                    rows += len(final_df)
+            break
+        except Exception as e:
+            if attempt == len(attempts) - 1:
+                print(f"Error reading file: {e}")
+                return False
+
+    print(f"Success! Normalized file saved to: {output_path} ({rows} rows)")
+    return True
+
+# --- BATCH MODE ---
+INPUT_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+MERGED_COLUMNS = ['nombre', 'email', 'telefono', 'renta', 'proyecto', 'observacion', 'source_file']
+
+def collect_inputs(pattern):
+    """Expands a directory or glob into export files, skipping previous outputs."""
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*')
+    paths = sorted(glob.glob(pattern))
+    return [p for p in paths
+            if p.lower().endswith(INPUT_EXTENSIONS) and not p.endswith('_normalized.csv')]
+
+def _normalize_one(input_path, output_path, chunksize, pg_dsn, pg_table, compact):
+    # Runs in a worker process; any failure is reported back instead of raised
+    try:
+        result = normalize_file(input_path, output_path, chunksize=chunksize,
+                                pg_dsn=pg_dsn, pg_table=pg_table, compact=compact)
+        return input_path, result, None if result else "see log above"
+    except Exception as e:
+        return input_path, None, f"{type(e).__name__}: {e}"
+
+def _append_to_merged(out, part_path, source, header):
+    # Per-file outputs are re-read as plain text so values pass through untouched
+    for chunk in pd.read_csv(part_path, dtype=str, keep_default_na=False, chunksize=100_000):
+        chunk['source_file'] = source
+        chunk.reindex(columns=MERGED_COLUMNS, fill_value="").to_csv(out, index=False, header=header)
+        header = False
+    return header
+
+def normalize_batch(inputs, merged_output=None, out_dir=None, workers=None, chunksize=None,
+                    pg_dsn=None, pg_table='leads', compact=False):
+    """
+    Normalizes many exports across a process pool (one process per core by
+    default). Writes one <name>_normalized.csv per input (in out_dir if given),
+    or, with merged_output, a single CSV with a source_file column. With pg_dsn
+    each worker also loads its file into Postgres. A file that fails is
+    reported and skipped; the rest of the batch continues.
+    Returns the list of (input, error) for the files that failed.
+    """
+    workers = workers or os.cpu_count() or 1
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='normalized_parts_') if merged_output else None
+    jobs = []
+    for i, path in enumerate(inputs):
+        name = f"{os.path.splitext(os.path.basename(path))[0]}_normalized.csv"
+        if tmp_dir:
+            out = os.path.join(tmp_dir, f"{i:05d}_{name}")
+        elif out_dir:
+            out = os.path.join(out_dir, name)
+        else:
+            out = None  # next to the input, as in single-file mode
+        jobs.append((path, out))
+
+    print(f"Batch: {len(jobs)} files, {workers} worker processes")
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_normalize_one, path, out, chunksize, pg_dsn, pg_table, compact) for path, out in jobs]
+        for future in as_completed(futures):
+            path, result, error = future.result()
+            results[path] = (result, error)
+            print(f"[batch] {'OK   ' if result else 'FAIL '} {path}" + (f" ({error})" if error else ""))
+
+    failed = [(path, results[path][1]) for path, _ in jobs if not results[path][0]]
+    if merged_output:
+        header = True
+        with open(merged_output, 'w', encoding='utf-8', newline='') as out:
+            for path, _ in jobs:
+                part = results[path][0]
+                if part:
+                    header = _append_to_merged(out, part, os.path.basename(path), header)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        print(f"Merged output saved to: {merged_output}")
+
+    print(f"Batch done: {len(jobs) - len(failed)} ok, {len(failed)} failed")
+    for path, error in failed:
+        print(f"  - {path}: {error}")
+    return failed
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python normalizer.py <input_file>")
-    else:
-        normalize_file(sys.argv[1])
+    parser = argparse.ArgumentParser(description="Normalize a lead export (.csv/.xlsx) to the CRM schema")
+    parser.add_argument("input_file", help="Export file, or a directory / glob for batch mode")
+    parser.add_argument("--output", help="Output CSV (default: <input>_normalized.csv). "
+                                         "In batch mode: one merged CSV with a source_file column")
+    parser.add_argument("--chunksize", type=int,
+                        help="Stream CSV input in chunks of this many rows (flat memory on huge files)")
+    parser.add_argument("--report-json", help="Run report with per-stage timings (default: <output>_report.json)")
+    parser.add_argument("--prom-textfile", help="Also write the metrics as a Prometheus textfile")
+    parser.add_argument("--out-dir", help="Batch mode: directory for the per-file outputs")
+    parser.add_argument("--workers", type=int, help="Batch mode: worker processes (default: CPU count)")
+    parser.add_argument("--copy-output", help="Also write a COPY file for the leads table (single-file mode)")
+    parser.add_argument("--pg-dsn", help="Load the leads straight into Postgres with COPY FROM STDIN")
+    parser.add_argument("--pg-table", default="leads", help="Target table for --pg-dsn")
+    parser.add_argument("--pg-batch-rows", type=int, default=PG_BATCH_ROWS,
+                        help="Rows per transaction when loading into Postgres")
+    parser.add_argument("--compact", action="store_true",
+                        help="Compact dtypes (categorical, Arrow strings, integer renta); reports memory saved")
+    parser.add_argument("--memo-size", type=int, default=MEMO_MAX_VALUES,
+                        help="Distinct values remembered per cleaner across streaming chunks (0: per chunk only)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only clean and write rows not seen by a previous run (single-file mode)")
+    parser.add_argument("--index-path", default=INDEX_PATH, help="Lead index used by --incremental")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.input_file) or glob.has_magic(args.input_file):
+        inputs = collect_inputs(args.input_file)
+        if not inputs:
+            print(f"Error: no .csv/.xlsx files match {args.input_file}")
+            sys.exit(1)
+        if args.copy_output:
+            parser.error("--copy-output is single-file only; use --pg-dsn to load a batch")
+        if args.incremental:
+            parser.error("--incremental is single-file only")
+        failed = normalize_batch(inputs, merged_output=args.output, out_dir=args.out_dir,
+                                 workers=args.workers, chunksize=args.chunksize,
+                                 pg_dsn=args.pg_dsn, pg_table=args.pg_table, compact=args.compact)
+        sys.exit(1 if failed else 0)
+
+    output = args.output or f"{os.path.splitext(args.input_file)[0]}_normalized.csv"
+    normalize_file(args.input_file, output, chunksize=args.chunksize,
+                   report_json=args.report_json or f"{os.path.splitext(output)[0]}_report.json",
+                   prom_textfile=args.prom_textfile, copy_output=args.copy_output,
+                   pg_dsn=args.pg_dsn, pg_table=args.pg_table, pg_batch_rows=args.pg_batch_rows,
+                   compact=args.compact, memo_size=args.memo_size,
+                   incremental=args.incremental, index_path=args.index_path)
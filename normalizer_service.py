@@ -0,0 +1,243 @@
+"""
+normalizer_service.py - Normalizador residente (HTTP local o socket Unix)
+=========================================================================
+Cada carga lanzaba un `python ai_normalizer.py` nuevo: importar pandas y
+requests, ensure_ollama y warmup se pagaban en cada archivo, y en uno chico
+eso era casi todo el tiempo. El servicio arranca una vez, deja el intérprete,
+las regex compiladas, la sesión HTTP con Ollama, los memos de limpiadores y el
+modelo cargados, y recibe trabajos:
+
+    POST /normalize   {"input": "/ruta/export.csv",
+                       "script": "ai_normalizer",        # o "normalizer"
+                       "output": "/ruta/salida.csv",     # opcional
+                       "args": ["--workers", "4"],       # opciones de ai_normalizer
+                       "options": {"chunksize": 50000}}  # kwargs de normalize_file
+      -> {"ok": true, "output": ..., "seconds": ..., "report": {...}}
+    GET  /health      -> {"ok": true, "jobs": ..., "uptime_seconds": ...}
+
+Un trabajo con error responde 500 ({"ok": false, "error": ...}); opciones
+inválidas, 400. Los trabajos corren de a --max-jobs a la vez (por defecto 1:
+comparten el mismo Ollama). Cada --keep-warm segundos se le pide a Ollama que
+mantenga el modelo cargado, así el primer trabajo después de un rato sin
+cargas no paga la carga del modelo.
+
+Uso:
+    python normalizer_service.py --port 8765
+    python normalizer_service.py --socket /tmp/normalizer.sock --no-llm
+    curl -s localhost:8765/normalize -d '{"input": "/data/prueba1.csv"}'
+    curl -s --unix-socket /tmp/normalizer.sock http://x/normalize -d '{"input": "..."}'
+"""
+
+import argparse
+import inspect
+import json
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+import ai_normalizer
+import normalizer
+
+MAX_BODY_BYTES = 1 << 20
+# Conexiones a Ollama que mantiene el servicio (los trabajos comparten la sesión)
+POOL_SIZE = 16
+
+# Opciones de normalize_file que puede pasar un trabajo (las rutas las fija el servicio)
+NORMALIZER_OPTIONS = set(inspect.signature(normalizer.normalize_file).parameters) - {
+    "input_path", "output_path", "memos"}
+
+
+class InvalidJob(ValueError):
+    """Pedido mal formado: se responde 400."""
+
+
+class NormalizerService:
+    def __init__(self, use_llm: bool = True, max_jobs: int = 1, keep_warm: float = 600,
+                 pool_size: int = POOL_SIZE):
+        self.use_llm = use_llm
+        # El pool se dimensiona una vez aquí; run() no toca la sesión que recibe
+        self.session = ai_normalizer.ollama_session(pool_size)
+        self.memos = ai_normalizer.lead_memos()
+        self.cleaner_memos = normalizer.cleaner_memos()
+        self.started = time.time()
+        self.jobs = 0
+        self.failed = 0
+        self._slots = threading.BoundedSemaphore(max(1, max_jobs))
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        if use_llm:
+            ai_normalizer.ensure_ollama(self.session)
+            ai_normalizer.warmup(self.session)
+            if keep_warm > 0:
+                threading.Thread(target=self._keep_warm, args=(keep_warm,), daemon=True).start()
+
+    def _keep_warm(self, interval: float):
+        # Sin prompt, Ollama solo (re)carga el modelo y renueva keep_alive
+        payload = {"model": ai_normalizer.OLLAMA_MODEL, "keep_alive": ai_normalizer.KEEP_ALIVE}
+        while not self._stop.wait(interval):
+            try:
+                self.session.post(ai_normalizer.OLLAMA_URL, json=payload, timeout=(5, 120))
+            except Exception as e:
+                print(f"⚠️  keep-warm falló: {e}")
+
+    def health(self) -> dict:
+        return {"ok": True, "llm": self.use_llm, "jobs": self.jobs, "failed": self.failed,
+                "uptime_seconds": round(time.time() - self.started, 1)}
+
+    def normalize(self, job: dict) -> dict:
+        """Corre un trabajo; InvalidJob si el pedido no es válido."""
+        input_path = job.get("input")
+        if not isinstance(input_path, str) or not input_path:
+            raise InvalidJob("falta 'input'")
+        if not os.path.exists(input_path):
+            raise InvalidJob(f"archivo no encontrado: {input_path}")
+        script = job.get("script", "ai_normalizer")
+        if script not in ("ai_normalizer", "normalizer"):
+            raise InvalidJob(f"script desconocido: {script}")
+
+        with self._slots:
+            start = time.perf_counter()
+            if script == "ai_normalizer":
+                output, report = self._run_ai(input_path, job)
+            else:
+                output, report = self._run_normalizer(input_path, job)
+            seconds = time.perf_counter() - start
+        with self._lock:
+            self.jobs += 1
+            self.failed += output is None
+        return {"ok": output is not None, "output": output, "seconds": round(seconds, 4), "report": report}
+
+    def _run_ai(self, input_path: str, job: dict):
+        extra = job.get("args") or []
+        if not isinstance(extra, list):
+            raise InvalidJob("'args' debe ser una lista")
+        argv = [input_path] + [str(a) for a in extra]
+        if job.get("output"):
+            argv += ["--output", job["output"]]
+        try:
+            args = ai_normalizer.build_parser().parse_args(argv)
+        except SystemExit:
+            raise InvalidJob(f"opciones inválidas para ai_normalizer: {argv[1:]}")
+        if not self.use_llm:
+            args.no_llm = True
+        output = args.output or input_path.replace(".csv", "_ai_normalized.csv")
+        args.report_json = args.report_json or os.path.splitext(output)[0] + "_report.json"
+        code = ai_normalizer.run(args, session=self.session, memos=self.memos)
+        return (output if code == 0 else None), _read_report(args.report_json)
+
+    def _run_normalizer(self, input_path: str, job: dict):
+        options = job.get("options") or {}
+        if not isinstance(options, dict):
+            raise InvalidJob("'options' debe ser un objeto")
+        options = dict(options)
+        unknown = set(options) - NORMALIZER_OPTIONS
+        if unknown:
+            raise InvalidJob(f"opciones inválidas para normalizer: {sorted(unknown)}")
+        output = job.get("output") or f"{os.path.splitext(input_path)[0]}_normalized.csv"
+        options.setdefault("report_json", f"{os.path.splitext(output)[0]}_report.json")
+        result = normalizer.normalize_file(input_path, output, memos=self.cleaner_memos, **options)
+        return result, _read_report(options["report_json"])
+
+    def close(self):
+        self._stop.set()
+        self.session.close()
+
+
+def _read_report(path: str):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    service: NormalizerService = None
+
+    def address_string(self):
+        # En socket Unix client_address es '' en vez de (host, puerto)
+        return self.client_address[0] if self.client_address else "unix"
+
+    def _send(self, status: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, self.service.health())
+        else:
+            self._send(404, {"ok": False, "error": "no encontrado"})
+
+    def do_POST(self):
+        if self.path != "/normalize":
+            self._send(404, {"ok": False, "error": "no encontrado"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self._send(413, {"ok": False, "error": "pedido demasiado grande"})
+            return
+        try:
+            job = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(job, dict):
+                raise InvalidJob("se espera un objeto JSON")
+            result = self.service.normalize(job)
+        except (InvalidJob, json.JSONDecodeError) as e:
+            self._send(400, {"ok": False, "error": str(e)})
+        except Exception as e:
+            print(f"❌ Trabajo falló: {e}")
+            self._send(500, {"ok": False, "error": f"{type(e).__name__}: {e}"})
+        else:
+            self._send(200 if result["ok"] else 500, result)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service: NormalizerService, port: int = 8765, socket_path: str = None):
+    handler = type("Handler", (ServiceHandler,), {"service": service})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        return ThreadingUnixHTTPServer(socket_path, handler)
+    # Solo local: el servicio lee y escribe rutas del disco
+    return ThreadingHTTPServer(("127.0.0.1", port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Normalizador residente para las cargas de leads")
+    parser.add_argument("--port", type=int, default=8765, help="Puerto HTTP en 127.0.0.1")
+    parser.add_argument("--socket", help="Escuchar en este socket Unix en vez de HTTP")
+    parser.add_argument("--no-llm", action="store_true", help="Sin Ollama: todos los trabajos usan heurística")
+    parser.add_argument("--max-jobs", type=int, default=1, help="Trabajos en paralelo")
+    parser.add_argument("--keep-warm", type=float, default=600,
+                        help="Segundos entre pedidos para mantener el modelo cargado (0: nunca)")
+    parser.add_argument("--pool-size", type=int, default=POOL_SIZE,
+                        help="Conexiones a Ollama que se mantienen abiertas (>= max-jobs x --workers)")
+    args = parser.parse_args()
+
+    service = NormalizerService(use_llm=not args.no_llm, max_jobs=args.max_jobs, keep_warm=args.keep_warm,
+                                pool_size=args.pool_size)
+    server = make_server(service, args.port, args.socket)
+    where = args.socket or f"http://127.0.0.1:{args.port}"
+    print(f"🟢 Normalizador escuchando en {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
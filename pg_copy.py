@@ -0,0 +1,177 @@
+"""
+pg_copy.py - Salida COPY para la tabla leads de PostgreSQL
+==========================================================
+Convierte las filas normalizadas al formato texto de COPY (separado por
+tabs, con los escapes de COPY) en el orden de columnas de la tabla leads:
+
+  nombre, email, renta, proyecto, telefono, observacion, rut, es_ia, clasificacion
+
+y, opcionalmente, las carga directo con COPY FROM STDIN en transacciones por
+lote, en vez de un INSERT por fila como server/bulk_load_leads.js.
+
+Cada lote se copia a una tabla temporal y desde ahí se inserta con
+ON CONFLICT DO NOTHING: un lead repetido (UNIQUE email, telefono, proyecto)
+se cuenta como omitido en lugar de abortar la carga completa. La tabla
+temporal numera las filas al copiarlas y el INSERT las toma en ese orden,
+así los leads quedan insertados en el orden del archivo, como con el
+INSERT fila a fila.
+
+La carga directa requiere psycopg 3 (pip install "psycopg[binary]").
+El archivo .copy se puede cargar a mano con:
+    psql "$DATABASE_URL" -c "\\copy leads (nombre, email, ...) FROM 'salida.copy'"
+"""
+
+from typing import Iterable, Iterator, Optional, Sequence, Tuple
+
+LEADS_COLUMNS = ("nombre", "email", "renta", "proyecto", "telefono",
+                 "observacion", "rut", "es_ia", "clasificacion")
+
+# Clave única de la tabla leads: identifica un lead ya cargado
+UNIQUE_KEY = ("email", "telefono", "proyecto")
+
+# Mismos valores por defecto que aplica server/bulk_load_leads.js
+DEFAULTS = {"nombre": "Sin Nombre", "proyecto": "Sin proyecto", "clasificacion": "Sin Clasificacion"}
+
+BATCH_ROWS = 20_000
+
+# Columna extra de la tabla temporal: posición de la fila en el lote
+STAGE_ORDER_COLUMN = "copy_orden"
+
+# Postgres no acepta NUL en columnas TEXT; el resto son los escapes de COPY
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\x00": None})
+
+
+def format_column(column: str, values: list) -> list:
+    """Valores de una columna como campos COPY, con defaults y escapes."""
+    if column == "es_ia":
+        return ["t" if str(v).strip().lower() in ("true", "t", "1") else "f" for v in values]
+    default = DEFAULTS.get(column, "")
+    # v != v descarta los NaN de pandas
+    return [default if v is None or v != v or v == "" else str(v).translate(_COPY_ESCAPES)
+            for v in values]
+
+
+def copy_block(columns: dict, rows: int) -> str:
+    """
+    Un lote de filas en formato COPY a partir de {columna: lista de valores};
+    las columnas de leads que falten quedan vacías (o con su default).
+    """
+    fields = [format_column(col, columns.get(col) or [""] * rows) for col in LEADS_COLUMNS]
+    return "".join(line + "\n" for line in map("\t".join, zip(*fields)))
+
+
+def iter_copy_blocks(records: Iterable[dict], batch_rows: int = BATCH_ROWS) -> Iterator[Tuple[str, int]]:
+    """Agrupa filas (dicts de la salida normalizada) en lotes COPY: (texto, filas)."""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_rows:
+            yield copy_block({c: [r.get(c) for r in batch] for c in LEADS_COLUMNS}, len(batch)), len(batch)
+            batch = []
+    if batch:
+        yield copy_block({c: [r.get(c) for r in batch] for c in LEADS_COLUMNS}, len(batch)), len(batch)
+
+
+def copy_sql(table: str = "leads") -> str:
+    return f"COPY {table} ({', '.join(LEADS_COLUMNS)}) FROM STDIN"
+
+
+def write_copy_file(blocks: Iterable[Tuple[str, int]], path: str) -> int:
+    """Escribe los lotes COPY en path. Retorna la cantidad de filas."""
+    total = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for data, rows in blocks:
+            f.write(data)
+            total += rows
+    return total
+
+
+def read_copy_file(path: str, batch_rows: int = BATCH_ROWS) -> Iterator[Tuple[str, int]]:
+    """Relee un archivo COPY en lotes de batch_rows líneas."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        batch = []
+        for line in f:
+            batch.append(line)
+            if len(batch) >= batch_rows:
+                yield "".join(batch), len(batch)
+                batch = []
+        if batch:
+            yield "".join(batch), len(batch)
+
+
+def _apply_through_stage(blocks: Iterable[Tuple[str, int]], dsn: str, table: str,
+                         sql: str) -> Iterator[Tuple[int, int]]:
+    """
+    Copia cada lote a la tabla temporal leads_copy_stage y ejecuta sql desde
+    ahí, una transacción por lote: un lote que falla se revierte solo y los
+    anteriores quedan confirmados. Entrega (filas del lote, filas afectadas).
+    """
+    try:
+        import psycopg
+    except ImportError:
+        raise RuntimeError('La carga directa a Postgres requiere psycopg 3: pip install "psycopg[binary]"')
+
+    with psycopg.connect(dsn, autocommit=True) as conn, conn.cursor() as cur:
+        cur.execute(f"CREATE TEMP TABLE leads_copy_stage (LIKE {table} INCLUDING DEFAULTS, "
+                    f"{STAGE_ORDER_COLUMN} bigserial) ON COMMIT DELETE ROWS")
+        for data, rows in blocks:
+            with conn.transaction():
+                with cur.copy(copy_sql("leads_copy_stage")) as copy:
+                    copy.write(data)
+                cur.execute(sql)
+                affected = cur.rowcount
+            yield rows, affected
+
+
+def load_copy_blocks(blocks: Iterable[Tuple[str, int]], dsn: str, table: str = "leads",
+                     metrics=None) -> Tuple[int, int]:
+    """
+    Carga los lotes con COPY FROM STDIN; un lead repetido se omite.
+    Retorna (insertados, omitidos por duplicado).
+    """
+    cols = ", ".join(LEADS_COLUMNS)
+    sql = (f"INSERT INTO {table} ({cols}) SELECT {cols} FROM leads_copy_stage "
+           f"ORDER BY {STAGE_ORDER_COLUMN} ON CONFLICT DO NOTHING")
+    inserted = skipped = 0
+    for rows, affected in _apply_through_stage(blocks, dsn, table, sql):
+        inserted += affected
+        skipped += rows - affected
+    if metrics is not None:
+        metrics.incr("pg_inserted", inserted)
+        metrics.incr("pg_skipped", skipped)
+    return inserted, skipped
+
+
+def update_copy_blocks(blocks: Iterable[Tuple[str, int]], dsn: str, table: str = "leads",
+                       columns: Sequence[str] = ("observacion", "es_ia"), metrics=None) -> int:
+    """
+    Actualiza solo las columnas indicadas de leads ya cargados (p. ej. el
+    backfill de resúmenes), cruzando por UNIQUE_KEY. Retorna las filas actualizadas.
+    """
+    assignments = ", ".join(f"{col} = s.{col}" for col in columns)
+    match = " AND ".join(f"t.{col} = s.{col}" for col in UNIQUE_KEY)
+    sql = f"UPDATE {table} t SET {assignments} FROM leads_copy_stage s WHERE {match}"
+    updated = sum(affected for _, affected in _apply_through_stage(blocks, dsn, table, sql))
+    if metrics is not None:
+        metrics.incr("pg_updated", updated)
+    return updated
+
+
+def export_copy(blocks: Iterable[Tuple[str, int]], copy_output: Optional[str] = None,
+                pg_dsn: Optional[str] = None, table: str = "leads",
+                batch_rows: int = BATCH_ROWS, metrics=None):
+    """
+    Punto de entrada de los normalizadores: escribe el archivo COPY y/o carga
+    a Postgres. Con ambos, la carga se hace desde el archivo ya escrito.
+    Retorna la cantidad de filas exportadas.
+    """
+    rows = None
+    if copy_output:
+        rows = write_copy_file(blocks, copy_output)
+        print(f"📦 Archivo COPY ({rows} filas): {copy_output}")
+        blocks = read_copy_file(copy_output, batch_rows)
+    if pg_dsn:
+        inserted, skipped = load_copy_blocks(blocks, pg_dsn, table, metrics)
+        print(f"🐘 Postgres ({table}): {inserted} leads insertados, {skipped} omitidos por duplicado")
+        rows = inserted + skipped
+    return rows
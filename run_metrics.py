@@ -0,0 +1,188 @@
+"""
+run_metrics.py - Timers, contadores y métricas de Ollama para los normalizadores
+================================================================================
+RunMetrics acumula el tiempo de cada etapa (read, parse, extract, summarize,
+write...), contadores arbitrarios, los hits/misses de los memos de limpiadores
+(memo.py) y, por cada llamada a Ollama, la latencia y los campos
+prompt_eval_count / eval_count / eval_duration de la respuesta.
+Al final se escribe un reporte JSON y, opcionalmente, un textfile de Prometheus
+para el textfile collector de node_exporter.
+
+Es seguro usarlo desde varios workers. Con workers en paralelo, el tiempo de
+una etapa es la suma de lo que tardó en cada hilo (no tiempo de reloj).
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+PROM_PREFIX = "leads_normalizer"
+
+
+def percentile(sorted_values, q):
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class RunMetrics:
+    def __init__(self, script: str):
+        self.script = script
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.memo = {}
+        self.llm_latencies = []
+        self.llm_tokens = {"prompt_eval_count": 0, "prompt_eval_duration": 0,
+                           "eval_count": 0, "eval_duration": 0}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, rows: int = 1):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start, rows)
+
+    def add_time(self, name: str, seconds: float, rows: int = 1):
+        with self._lock:
+            st = self.stages.setdefault(name, {"seconds": 0.0, "rows": 0})
+            st["seconds"] += seconds
+            st["rows"] += rows
+
+    def timed_iter(self, name: str, iterable, rows_of=None):
+        """
+        Envuelve un iterable (p. ej. un lector en streaming) cronometrando cada
+        next(). rows_of(item) indica cuántas filas trae cada item (1 por defecto).
+        """
+        it = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.add_time(name, time.perf_counter() - start, 0)
+                return
+            self.add_time(name, time.perf_counter() - start, rows_of(item) if rows_of else 1)
+            yield item
+
+    def incr(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe_memo(self, name: str, hits: int, misses: int):
+        """Acumula hits/misses del memo de un limpiador (ver memo.py)."""
+        with self._lock:
+            st = self.memo.setdefault(name, {"hits": 0, "misses": 0})
+            st["hits"] += hits
+            st["misses"] += misses
+
+    def observe_llm(self, latency: float, response: dict):
+        """Registra una respuesta exitosa de /api/generate."""
+        with self._lock:
+            self.llm_latencies.append(latency)
+            for key in self.llm_tokens:
+                value = response.get(key)
+                if isinstance(value, (int, float)):
+                    self.llm_tokens[key] += int(value)
+
+    def llm_summary(self) -> dict:
+        lat = sorted(self.llm_latencies)
+        tok = self.llm_tokens
+        return {
+            "requests": len(lat),
+            "latency_seconds": {
+                "p50": percentile(lat, 50), "p90": percentile(lat, 90),
+                "p99": percentile(lat, 99), "max": lat[-1] if lat else None,
+                "mean": sum(lat) / len(lat) if lat else None,
+            },
+            "prompt_tokens": tok["prompt_eval_count"],
+            "completion_tokens": tok["eval_count"],
+            # Las duraciones de Ollama vienen en nanosegundos
+            "prompt_tokens_per_s": (tok["prompt_eval_count"] / (tok["prompt_eval_duration"] / 1e9)
+                                    if tok["prompt_eval_duration"] else None),
+            "completion_tokens_per_s": (tok["eval_count"] / (tok["eval_duration"] / 1e9)
+                                        if tok["eval_duration"] else None),
+        }
+
+    def report(self) -> dict:
+        with self._lock:
+            stages = {name: {"seconds": round(st["seconds"], 4), "rows": st["rows"],
+                             "rows_per_s": round(st["rows"] / st["seconds"], 1) if st["seconds"] else None}
+                      for name, st in self.stages.items()}
+            return {
+                "script": self.script,
+                "started_at": self.started,
+                "wall_seconds": round(time.perf_counter() - self._t0, 4),
+                "stages": stages,
+                "counters": dict(self.counters),
+                "memo": {name: {**st, "hit_rate": round(st["hits"] / (st["hits"] + st["misses"]), 4)
+                                if st["hits"] + st["misses"] else None}
+                         for name, st in self.memo.items()},
+                "llm": self.llm_summary(),
+            }
+
+    def print_summary(self):
+        rep = self.report()
+        print(f"⏱️  Tiempo total: {rep['wall_seconds']:.2f}s")
+        for name, st in rep["stages"].items():
+            print(f"   {name:<10} {st['seconds']:>9.3f}s  {st['rows']:>8} filas")
+        for name, st in rep["memo"].items():
+            if st["hit_rate"] is not None:
+                print(f"   memo {name}: {st['hit_rate']:.1%} hits ({st['misses']} valores calculados "
+                      f"para {st['hits'] + st['misses']} celdas)")
+        llm = rep["llm"]
+        if llm["requests"]:
+            lat = llm["latency_seconds"]
+            print(f"   LLM: {llm['requests']} llamadas, p50 {lat['p50']:.2f}s / p90 {lat['p90']:.2f}s "
+                  f"/ p99 {lat['p99']:.2f}s")
+            if llm["completion_tokens_per_s"]:
+                print(f"   LLM: {llm['completion_tokens_per_s']:.1f} tokens/s generación, "
+                      f"{llm['prompt_tokens']} tokens de prompt")
+
+    def write_json(self, path: str):
+        _atomic_write(path, json.dumps(self.report(), ensure_ascii=False, indent=2))
+
+    def write_prometheus(self, path: str):
+        """Formato texto de Prometheus, para el textfile collector de node_exporter."""
+        rep = self.report()
+        llm = rep["llm"]
+        label = f'script="{self.script}"'
+        series = {
+            "run_seconds": [(label, rep["wall_seconds"])],
+            "last_run_timestamp_seconds": [(label, int(self.started))],
+            "stage_seconds": [(f'{label},stage="{n}"', st["seconds"]) for n, st in rep["stages"].items()],
+            "stage_rows": [(f'{label},stage="{n}"', st["rows"]) for n, st in rep["stages"].items()],
+            "events": [(f'{label},event="{n}"', v) for n, v in rep["counters"].items()],
+            "memo_hits": [(f'{label},cleaner="{n}"', st["hits"]) for n, st in rep["memo"].items()],
+            "memo_misses": [(f'{label},cleaner="{n}"', st["misses"]) for n, st in rep["memo"].items()],
+            "llm_requests": [(label, llm["requests"])],
+            "llm_latency_seconds": [(f'{label},quantile="0.{q[1:]}"', round(llm["latency_seconds"][q], 4))
+                                    for q in ("p50", "p90", "p99") if llm["latency_seconds"][q] is not None],
+            "llm_prompt_tokens_per_s": [(label, round(llm["prompt_tokens_per_s"], 2))]
+                                       if llm["prompt_tokens_per_s"] is not None else [],
+            "llm_completion_tokens_per_s": [(label, round(llm["completion_tokens_per_s"], 2))]
+                                           if llm["completion_tokens_per_s"] is not None else [],
+        }
+        lines = []
+        for name, samples in series.items():
+            if not samples:
+                continue
+            lines.append(f"# TYPE {PROM_PREFIX}_{name} gauge")
+            lines.extend(f"{PROM_PREFIX}_{name}{{{labels}}} {value}" for labels, value in samples)
+        _atomic_write(path, "\n".join(lines) + "\n")
+
+
+def _atomic_write(path: str, content: str):
+    # node_exporter puede leer el archivo en cualquier momento: escribir y renombrar
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp, path)
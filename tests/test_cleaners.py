@@ -0,0 +1,60 @@
+"""
+Parity between the per-cell cleaners in normalizer.py and their column-wide
+versions: clean_*_column(series) must equal series.apply(clean_*).
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import normalizer
+
+CELLS = [
+    None, np.nan, "", " ", "\n",
+    0, 1, 1000, 1001, 987654321, 56987654321, 1.5, 1200000.0,
+    "987654321", "+56 9 8765 4321", "(9) 8765-4321", "12345678", "56912345678", "0056912345678",
+    "1.200.000_a_1.500.000", "$1.000.000 - $1.500.000", "500", "1.000", "1.001", "..5..",
+    "99999999999999999999999", "renta 800 mil, o sea 800.000",
+    "Juan@Mail.CL", "  contacto: ANA.perez@correo-chile.cl ", "\\nmaria@x.cl", "no tiene", "a@b",
+    "José 9 8765 4321", "ñandú@correo.cl", "１２３４５６７８９", "renta ２.０００.０００",
+    "desde\n500 hasta 1.500.000", "entre\n500 y 1.200.000", "línea\n\nfono 9 8765 4321\n",
+    "correo:\nPEDRO@MAIL.CL\nfin", "uno\r\ndos 3.000.000",
+]
+
+PAIRS = [
+    (normalizer.clean_phone, normalizer.clean_phone_column),
+    (normalizer.clean_rent, normalizer.clean_rent_column),
+    (normalizer.clean_email, normalizer.clean_email_column),
+    (normalizer.extract_email_from_text, normalizer.extract_email_column),
+]
+
+
+def _series_cases():
+    yield "mixed", pd.Series(CELLS, dtype=object)
+    yield "strings", pd.Series([c for c in CELLS if isinstance(c, str)], dtype=object)
+    yield "ints", pd.Series([0, 5, 1000, 1001, 987654321, 56987654321], dtype="int64")
+    yield "floats", pd.Series([np.nan, 1.5, 1001.0, 987654321.0], dtype="float64")
+    yield "empty", pd.Series([], dtype=object)
+    yield "all-null", pd.Series([None, np.nan], dtype=object)
+    yield "index", pd.Series(["9 8765 4321", "desde\n500 hasta 1.500.000", None], index=[10, 3, 7])
+
+
+@pytest.mark.parametrize("cell_fn,column_fn", PAIRS, ids=lambda f: getattr(f, "__name__", ""))
+@pytest.mark.parametrize("name,series", list(_series_cases()), ids=lambda v: v if isinstance(v, str) else "")
+def test_column_matches_per_cell(cell_fn, column_fn, name, series):
+    expected = series.apply(cell_fn)
+    result = column_fn(series)
+    assert list(result.index) == list(series.index)
+    assert result.tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize("cell", CELLS, ids=repr)
+@pytest.mark.parametrize("cell_fn,column_fn", PAIRS, ids=lambda f: getattr(f, "__name__", ""))
+def test_single_cell(cell_fn, column_fn, cell):
+    series = pd.Series([cell], dtype=object)
+    assert column_fn(series).tolist() == [cell_fn(cell)]
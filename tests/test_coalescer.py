@@ -0,0 +1,72 @@
+"""
+SummaryCoalescer: a lead that shares a conversation with an earlier lead gets
+that lead's summary only if it can be rewritten to its own name and phone
+without leaving any of the earlier lead's data behind.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_normalizer
+
+CONV = "BOT: Hola, ¿en qué proyecto estás interesado?\nCLIENTE: Busco depto de 2 dormitorios"
+SOL = ("Sol Rojas", "+56911112222")
+MARIA = ("María Pérez", "+56933334444")
+
+
+class StubLLM:
+    """Stands in for ollama_summary; write(nombre, telefono) is the model's reply."""
+
+    def __init__(self, write):
+        self.write = write
+        self.calls = []
+
+    def __call__(self, session, nombre, telefono, tag_estado, conv, *args):
+        self.calls.append(nombre)
+        return self.write(nombre, telefono), True
+
+
+def summarize_both(write):
+    llm = StubLLM(write)
+    coalescer = ai_normalizer.SummaryCoalescer(summarize=llm)
+    sol = coalescer.summary(None, *SOL, "Interesado", CONV)
+    maria = coalescer.summary(None, *MARIA, "Interesado", CONV)
+    return llm, coalescer, sol, maria
+
+
+def test_verbatim_identity_is_shared_and_rewritten():
+    llm, coalescer, _, (texto, por_ia) = summarize_both(
+        lambda nombre, telefono: f"Solicita info. {nombre} ({telefono}) busca 2 dormitorios.")
+    assert llm.calls == ["Sol Rojas"]
+    assert coalescer.saved == 1
+    assert por_ia
+    # Word-bounded: "Solicita" is not a mention of "Sol"
+    assert texto == "Solicita info. María Pérez (+56933334444) busca 2 dormitorios."
+
+
+def test_paraphrased_identity_is_summarized_separately():
+    def paraphrase(nombre, telefono):
+        d = telefono[-9:]
+        return f"{nombre.split()[0]} solicita info. Teléfono +56 {d[0]} {d[1:5]} {d[5:]}"
+
+    llm, coalescer, _, (texto, por_ia) = summarize_both(paraphrase)
+    assert llm.calls == ["Sol Rojas", "María Pérez"]
+    assert coalescer.saved == 0
+    assert texto == "María solicita info. Teléfono +56 9 3333 4444"
+
+
+def test_leftover_first_name_is_not_leaked():
+    llm, coalescer, _, (texto, _) = summarize_both(
+        lambda nombre, telefono: f"{nombre}, {telefono}. {nombre.split()[0]} pide visita.")
+    assert llm.calls == ["Sol Rojas", "María Pérez"]
+    assert texto == "María Pérez, +56933334444. María pide visita."
+
+
+def test_personalizar():
+    assert ai_normalizer.personalizar("Sol Rojas: +56911112222", SOL, MARIA) == "María Pérez: +56933334444"
+    assert ai_normalizer.personalizar("Sol: +56911112222", SOL, MARIA) is None
+    assert ai_normalizer.personalizar("Sol Rojas: +56 9 1111 2222", SOL, MARIA) is None
+    # Same identity: nothing to rewrite
+    assert ai_normalizer.personalizar("Sol pide visita", SOL, SOL) == "Sol pide visita"
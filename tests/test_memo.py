@@ -0,0 +1,41 @@
+"""
+ValueMemo: a memo shared across columns (streaming chunks, service jobs) must
+give the same result as the direct cleaner, whatever it has seen before.
+"""
+
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import normalizer
+from memo import ValueMemo
+
+
+def phone_memo():
+    return ValueMemo("clean_phone", normalizer.clean_phone, normalizer.clean_phone_column)
+
+
+def test_int_then_float_column_does_not_share_entries():
+    memo = phone_memo()
+    ints = pd.Series([987654321, 56912345678], dtype="int64")
+    floats = pd.Series([987654321.0, 56912345678.0], dtype="float64")
+
+    assert memo.map(ints).tolist() == normalizer.clean_phone_column(ints).tolist()
+    assert memo.map(floats).tolist() == normalizer.clean_phone_column(floats).tolist()
+    assert memo.map(floats).tolist() == phone_memo().map(floats).tolist()
+
+
+def test_int_then_float_cell_does_not_share_entries():
+    memo = phone_memo()
+    assert memo(987654321) == normalizer.clean_phone(987654321)
+    assert memo(987654321.0) == normalizer.clean_phone(987654321.0)
+
+
+def test_repeated_values_hit():
+    memo = phone_memo()
+    memo.map(pd.Series(["987654321", "987654321"], dtype=object))
+    memo.map(pd.Series(["987654321"], dtype=object))
+    assert (memo.hits, memo.misses) == (2, 1)
@@ -0,0 +1,73 @@
+"""
+Loading a normalized export into a throwaway Postgres with pg_copy. Runs only
+when PG_TEST_DSN points at a database the test may create tables in, e.g.
+
+    PG_TEST_DSN=postgresql://postgres@localhost/leads_test python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import normalizer
+import pg_copy
+from benchmarks.generate_leads import generate
+
+DSN = os.environ.get("PG_TEST_DSN")
+pytestmark = pytest.mark.skipif(not DSN, reason="PG_TEST_DSN no está definido")
+
+# Columnas de leads que escribe pg_copy y la clave única, como en server/sandbox_setup.sql
+LEADS_DDL = """CREATE TABLE {table} (
+    id bigserial PRIMARY KEY,
+    nombre text, email text, telefono text, renta text, proyecto text,
+    observacion text, rut text, es_ia boolean DEFAULT false, clasificacion text,
+    UNIQUE (email, telefono, proyecto))"""
+
+
+@pytest.fixture
+def leads_table():
+    psycopg = pytest.importorskip("psycopg")
+    table = f"leads_test_{os.getpid()}"
+    with psycopg.connect(DSN, autocommit=True) as conn:
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.execute(LEADS_DDL.format(table=table))
+    try:
+        yield table
+    finally:
+        with psycopg.connect(DSN, autocommit=True) as conn:
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+def _keys_in_file_order(copy_path):
+    """Claves únicas del archivo COPY en orden, sin las repetidas."""
+    email, proyecto, telefono = (pg_copy.LEADS_COLUMNS.index(c) for c in ("email", "proyecto", "telefono"))
+    keys = {}
+    with open(copy_path, encoding="utf-8", newline="") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            keys.setdefault((fields[email], fields[telefono], fields[proyecto]), None)
+    return list(keys)
+
+
+def test_load_keeps_file_order_and_rerun_skips_everything(tmp_path, leads_table):
+    import psycopg
+
+    source = generate("portal-csv", 2000, str(tmp_path / "portal.csv"), seed=1)
+    copy_path = str(tmp_path / "portal.copy")
+    assert normalizer.normalize_file(source, str(tmp_path / "portal_normalized.csv"), copy_output=copy_path)
+    keys = _keys_in_file_order(copy_path)
+    with open(copy_path, encoding="utf-8") as f:
+        rows = sum(1 for _ in f)
+
+    # Lotes chicos para que la carga cruce varias transacciones
+    inserted, skipped = pg_copy.load_copy_blocks(pg_copy.read_copy_file(copy_path, 300), DSN, leads_table)
+    assert (inserted, skipped) == (len(keys), rows - len(keys))
+
+    with psycopg.connect(DSN) as conn:
+        loaded = conn.execute(f"SELECT email, telefono, proyecto FROM {leads_table} ORDER BY id").fetchall()
+    assert [tuple(r) for r in loaded] == keys
+
+    assert pg_copy.load_copy_blocks(pg_copy.read_copy_file(copy_path, 300), DSN, leads_table) == (0, rows)
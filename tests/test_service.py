@@ -0,0 +1,42 @@
+"""
+NormalizerService keeps its cleaner memos across jobs: each job's output must
+still match a standalone normalize_file run on the same file.
+"""
+
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import normalizer
+import normalizer_service
+
+
+def _export(path, telefonos, rentas):
+    pd.DataFrame({
+        "Nombre": [f"Lead {i}" for i in range(len(telefonos))],
+        "Email": [f"lead{i}@mail.cl" for i in range(len(telefonos))],
+        "Teléfono": telefonos,
+        "Renta": rentas,
+    }).to_excel(path, index=False)
+    return path
+
+
+def test_jobs_with_different_dtypes_match_standalone_runs(tmp_path):
+    # Same numbers, read back as int64 in one file and float64 (a blank cell) in the other
+    ints = _export(tmp_path / "ints.xlsx", [987654321, 56912345678, 912345678], [1000, 1500000, 800])
+    floats = _export(tmp_path / "floats.xlsx", [987654321, 56912345678, None], [1000, 1500000, None])
+
+    service = normalizer_service.NormalizerService(use_llm=False)
+    try:
+        for path in (ints, floats):
+            result = service.normalize({"input": str(path), "script": "normalizer",
+                                        "output": str(tmp_path / f"{path.stem}_service.csv")})
+            assert result["ok"]
+            expected = normalizer.normalize_file(str(path), str(tmp_path / f"{path.stem}_alone.csv"))
+            with open(result["output"], "rb") as a, open(expected, "rb") as b:
+                assert a.read() == b.read(), path.name
+    finally:
+        service.close()
@@ -0,0 +1,113 @@
+"""
+transcript.py - Decodificador de transcripciones de chat compartido
+====================================================================
+Usado por ai_normalizer.parse_chat y normalizer.summarize_chat para convertir
+la columna de transcripción en una lista de mensajes {sender, message}.
+
+1. Camino rápido: JSON estándar (orjson si está instalado, si no json).
+2. Camino tolerante: un escáner que extrae los pares sender/message de
+   payloads rotos, truncados, con comillas duplicadas ("" -> ") o escritos
+   como literales de Python ('sender': 'user'), sin usar ast.literal_eval.
+"""
+
+import json
+import re
+from typing import List
+
+try:
+    import orjson
+except ImportError:  # opcional: solo acelera el camino rápido
+    orjson = None
+
+# Clave conocida seguida de su valor: string entre comillas simples o dobles
+# (con escapes), o null/None. Las claves también pueden venir en ambas comillas.
+PAIR_RE = re.compile(
+    r"""(["'])(sender|from|message|text)\1\s*:\s*"""
+    r"""(?:"([^"\\]*(?:\\.[^"\\]*)*)"|'([^'\\]*(?:\\.[^'\\]*)*)'|(null|None))""",
+    re.DOTALL,
+)
+ESCAPE_RE = re.compile(r"\\(u[0-9a-fA-F]{4}|x[0-9a-fA-F]{2}|.)", re.DOTALL)
+ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "/": "/"}
+
+SENDER_KEYS  = ("sender", "from")
+MESSAGE_KEYS = ("message", "text")
+
+
+def unescape_doubled_quotes(s: str) -> str:
+    """Restaura comillas de CSV duplicadas ("" -> ") en payloads de chat."""
+    if isinstance(s, str) and '""' in s and ('sender' in s or 'message' in s):
+        return s.replace('""', '"')
+    return s
+
+
+def loads_json(s: str):
+    """json.loads, usando orjson cuando está disponible. Lanza ValueError si falla."""
+    if orjson is not None:
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            pass  # orjson es más estricto (NaN, enteros gigantes): se reintenta con json
+    return json.loads(s)
+
+
+def _unescape(value: str) -> str:
+    if "\\" not in value:
+        return value
+
+    def repl(m):
+        esc = m.group(1)
+        if len(esc) > 1:
+            return chr(int(esc[1:], 16))
+        return ESCAPES.get(esc, esc)
+
+    return ESCAPE_RE.sub(repl, value)
+
+
+def scan_messages(s: str) -> List[dict]:
+    """
+    Extrae los mensajes de un payload que no es JSON válido. Cada vez que se
+    repite una clave ya vista (p. ej. un segundo 'sender') empieza un mensaje
+    nuevo, así que no depende de que llaves o corchetes estén balanceados.
+    """
+    messages = []
+    current = {}
+    for m in PAIR_RE.finditer(s):
+        key = m.group(2)
+        group = SENDER_KEYS if key in SENDER_KEYS else MESSAGE_KEYS
+        if any(k in current for k in group):
+            messages.append(current)
+            current = {}
+        if m.group(5) is not None:
+            current[key] = None
+        else:
+            raw = m.group(3) if m.group(3) is not None else m.group(4)
+            current[key] = _unescape(raw)
+    if current:
+        messages.append(current)
+    return messages
+
+
+def decode_transcript(raw: str):
+    """
+    Decodifica una transcripción. Retorna el valor JSON si el payload es JSON
+    válido (normalmente una lista de dicts) o la lista de mensajes recuperados
+    por el escáner si está roto. Lanza ValueError si no hay nada reconocible.
+    """
+    s = raw.strip()
+    try:
+        return loads_json(s)
+    except ValueError:
+        pass
+    # Recién ahora se prueban las comillas duplicadas: hacerlo antes rompería
+    # JSON válido con strings vacíos ("message": "") o que terminan en \"
+    unescaped = s
+    if '""sender""' in s or '""message""' in s:
+        unescaped = unescape_doubled_quotes(s)
+        try:
+            return loads_json(unescaped)
+        except ValueError:
+            pass
+    messages = scan_messages(unescaped)
+    if messages:
+        return messages
+    raise ValueError("transcripción sin mensajes reconocibles")